@@ -15,7 +15,12 @@ const int mqttPort = 1883;                      // Default port for MQTT
 const char* mqttUser = "RF_SMART_CARD_0192";    // Leave blank if no authentication
 const char* mqttPassword = "RF_SMART_CARD_11"; // Leave blank if no authentication
 
-const char* publish_topic = "RF_SMART_CART_DTS";
+// Leave cart_id empty when main.py runs this cart on its own: scans go to RF_SMART_CART_DTS.
+// With cart_server.py give every cart its own number (and pass the same --cart-id to its
+// screen): scans go to RF_SMART_CART_DTS/<cart_id>, and the bill comes back on RF_SMART_CART_BILL/<cart_id>
+const char* cart_id = "";
+String publish_topic = strlen(cart_id) ? String("RF_SMART_CART_DTS/") + cart_id : String("RF_SMART_CART_DTS");
+String client_id = String("ArduinoNano33IoTClient") + cart_id;  // The broker drops a client whose id is reused
 
 WiFiClient wifiClient;
 PubSubClient client(wifiClient);
@@ -144,7 +149,7 @@ void add_item_lcd(String item) {
 
   String pkt = "+,"+String(item);
   // Send a message to the MQTT broker
-  publishMessage(publish_topic, pkt.c_str());
+  publishMessage(publish_topic.c_str(), pkt.c_str());
   
   delay(1500);
 }
@@ -161,7 +166,7 @@ void remove_item_lcd(String item) {
   lcd.print("Successfully Removed");
   String pkt = "-,"+String(item);
   // Send a message to the MQTT broker
-  publishMessage(publish_topic, pkt.c_str());
+  publishMessage(publish_topic.c_str(), pkt.c_str());
   
   delay(1500);
 }
@@ -255,7 +260,7 @@ void connectToMqtt() {
     Serial.println("Connecting to MQTT...");
 
     // Connect to the broker with optional username/password
-    if (client.connect("ArduinoNano33IoTClient", mqttUser, mqttPassword)) {
+    if (client.connect(client_id.c_str(), mqttUser, mqttPassword)) {
       Serial.println("Connected to MQTT broker");
     } else {
       Serial.print("Failed with state ");
@@ -0,0 +1,189 @@
+"""End-of-day analytics over the sales log
+
+Each day's segment is memory-mapped as a NumPy record array and reduced with bincount,
+so millions of sale lines are aggregated without building Python objects per line.
+
+    python analytics.py                          # everything in ./sales
+    python analytics.py --days 7 --top 20        # last week only
+    python analytics.py --json                   # machine-readable output
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from sales_log import HEADER, MAGIC, RECORD, SUMMARY_CODE, SalesLog
+from storage import open_storage
+
+# Matches sales_log.RECORD field for field
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<u4"),
+    ("sale_id", "<u4"),
+    ("quantity", "<i4"),
+    ("unit", "<i4"),
+    ("net", "<i4"),
+    ("item_code", "S8"),
+    ("cart_id", "<u2"),
+    ("reserved", "<u2"),
+])
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+
+def map_segment(path):
+    """Read-only memory map of a segment's records; a torn last record is left out"""
+    with open(path, "rb") as file:
+        header = file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"{path} is too short to be a sales segment")
+    magic, record_size, _ = HEADER.unpack(header)
+    if magic != MAGIC or record_size != RECORD.size:
+        raise ValueError(f"{path} is not a sales segment")
+    count = (os.path.getsize(path) - HEADER.size) // RECORD.size
+    if count <= 0:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER.size, shape=(count,))
+
+
+def select_segments(directory, days=None):
+    paths = SalesLog(directory).segments()
+    if days:
+        cutoff = time.strftime("%Y-%m-%d", time.localtime(time.time() - (days - 1) * 86400))
+        paths = [path for path in paths if os.path.basename(path)[:10] >= cutoff]
+    return paths
+
+
+class SalesSummary:
+    """Totals accumulated segment by segment; only per-SKU and per-hour arrays are kept"""
+
+    def __init__(self):
+        self.hourly_revenue = np.zeros(24, dtype=np.int64)  # paise, by local hour of day
+        self.hourly_sales = np.zeros(24, dtype=np.int64)
+        self.sales = 0
+        self.units = 0
+        self.revenue = 0
+        self.sku_units = {}  # item_code -> units, merged from each segment's (small) unique set
+        self.sku_revenue = {}
+        self.first = None
+        self.last = None
+
+    def add_segment(self, records, utc_offset):
+        if not len(records):
+            return
+        summary = records["item_code"] == SUMMARY_CODE
+        totals = records[summary]
+        lines = records[~summary]
+
+        # Per-sale figures come from the summary records: one per basket
+        hours = ((totals["timestamp"].astype(np.int64) + utc_offset) // 3600) % 24
+        self.hourly_revenue += np.bincount(hours, weights=totals["net"], minlength=24).astype(np.int64)
+        self.hourly_sales += np.bincount(hours, minlength=24)
+        self.sales += len(totals)
+        self.units += int(totals["quantity"].sum(dtype=np.int64))
+        self.revenue += int(totals["net"].sum(dtype=np.int64))
+
+        # Per-SKU: group by item code with unique + bincount instead of a Python loop per line
+        codes, inverse = np.unique(lines["item_code"], return_inverse=True)
+        units = np.bincount(inverse, weights=lines["quantity"], minlength=len(codes))
+        revenue = np.bincount(inverse, weights=lines["net"], minlength=len(codes))
+        for code, unit_count, paise in zip(codes, units, revenue):
+            code = code.decode("ascii")
+            self.sku_units[code] = self.sku_units.get(code, 0) + int(unit_count)
+            self.sku_revenue[code] = self.sku_revenue.get(code, 0) + int(paise)
+
+        first, last = int(records["timestamp"].min()), int(records["timestamp"].max())
+        self.first = first if self.first is None else min(self.first, first)
+        self.last = last if self.last is None else max(self.last, last)
+
+    def average_basket(self):
+        if not self.sales:
+            return {"units": 0.0, "paise": 0.0}
+        return {"units": self.units / self.sales, "paise": self.revenue / self.sales}
+
+    def top_skus(self, count=10):
+        ranked = sorted(self.sku_units.items(), key=lambda entry: entry[1], reverse=True)
+        return [(code, units, self.sku_revenue[code]) for code, units in ranked[:count]]
+
+    def depletion_forecast(self, items, days_observed):
+        """Days until each item runs out at the observed sales rate, soonest first"""
+        codes = [item.item_code for item in items]
+        stock = np.array([item.quantity for item in items], dtype=np.float64)
+        sold = np.array([self.sku_units.get(code, 0) for code in codes], dtype=np.float64)
+        rate = sold / max(days_observed, 1e-9)  # Units per day
+        with np.errstate(divide="ignore"):
+            days_left = np.where(rate > 0, stock / rate, np.inf)
+        order = np.argsort(days_left, kind="stable")
+        return [(items[i].item_code, items[i].item_name, int(stock[i]), float(rate[i]), float(days_left[i]))
+                for i in order if np.isfinite(days_left[i])]
+
+
+def summarize(directory="sales", days=None):
+    utc_offset = -time.altzone if time.localtime().tm_isdst > 0 else -time.timezone
+    summary = SalesSummary()
+    for path in select_segments(directory, days):
+        try:
+            records = map_segment(path)
+        except ValueError as e:
+            print(f"Skipping sales segment {path}: {e}")
+            continue
+        summary.add_segment(records, utc_offset)
+    return summary
+
+
+def days_observed(summary, days):
+    if days:
+        return days
+    if summary.first is None:
+        return 0
+    return max(1.0, (summary.last - summary.first) / 86400)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sales analytics over the append-only sales log")
+    parser.add_argument("--sales", default="sales", help="sales log directory")
+    parser.add_argument("--days", type=int, help="only look at the last N days")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--db", default="smart_cart.db")
+    parser.add_argument("--inventory", default="inventory.json")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    summary = summarize(args.sales, args.days)
+    storage = open_storage(args.storage, args.db, args.inventory)
+    items = storage.load_items()
+    storage.close()
+    forecast = summary.depletion_forecast(items, days_observed(summary, args.days))
+    elapsed = time.perf_counter() - started
+
+    report = {
+        "sales": summary.sales,
+        "units": summary.units,
+        "revenue_paise": summary.revenue,
+        "average_basket": summary.average_basket(),
+        "hourly_revenue_paise": summary.hourly_revenue.tolist(),
+        "hourly_sales": summary.hourly_sales.tolist(),
+        "top_skus": [{"item_code": code, "units": units, "revenue_paise": paise} for code, units, paise in summary.top_skus(args.top)],
+        "depletion": [{"item_code": code, "item_name": name, "stock": stock, "per_day": round(rate, 2), "days_left": round(days_left, 1)}
+                      for code, name, stock, rate, days_left in forecast],
+        "seconds": round(elapsed, 3)
+    }
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print(f"{summary.sales} sales, {summary.units} units, Rs. {summary.revenue / 100:.2f} revenue")
+        basket = summary.average_basket()
+        print(f"Average basket: {basket['units']:.1f} units, Rs. {basket['paise'] / 100:.2f}")
+        print("Revenue by hour:")
+        for hour in range(24):
+            if summary.hourly_sales[hour]:
+                print(f"  {hour:02d}:00  {summary.hourly_sales[hour]:>6} sales  Rs. {summary.hourly_revenue[hour] / 100:>10.2f}")
+        print("Top sellers:")
+        for code, units, paise in summary.top_skus(args.top):
+            print(f"  {code:<8} {units:>8} units  Rs. {paise / 100:>10.2f}")
+        print("Stock running out:")
+        for code, name, stock, rate, days_left in forecast[:args.top]:
+            print(f"  {code:<8} {name:<20} {stock:>6} left, {rate:.1f}/day, {days_left:.1f} days")
+        print(f"({elapsed:.2f} s)")
@@ -0,0 +1,319 @@
+"""Headless replay benchmark for the scan -> bill pipeline
+
+Drives the same ScanQueue -> coalesce -> Cart path the app uses, without Tk or MQTT,
+from synthetic or recorded scan traces, and reports events/s, scan-to-bill latency,
+bytes written per scan and peak RSS. Results can be saved as JSON baselines and
+compared against later runs.
+
+    python bench.py                                  # default scenario matrix
+    python bench.py --items 50000 --scans 5000 --rate 200 --remove-ratio 0.2
+    python bench.py --trace scans.jsonl              # replay a recorded trace against ./inventory.json
+    python bench.py --trace scans.jsonl --inventory shop.json
+    python bench.py --save bench_baselines/v1.json   # store a baseline
+    python bench.py --compare bench_baselines/v1.json
+    python bench.py --tk                             # also time BillTable redraws (needs a display)
+
+A recorded trace is JSON lines of {"t": <seconds since start>, "payload": "+,Kiwi"}. It
+names real items, so it is replayed against a copy of a real inventory instead of the
+synthetic catalog.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from bill import Bill
+from cart import Cart
+from catalog import Catalog
+from ingest import ScanQueue, coalesce
+from protocol import parse_payload
+from storage import open_storage, write_json_atomic
+
+PUMP_INTERVAL = 0.05  # Same cadence as SCAN_PUMP_INTERVAL_MS in main.py
+BATCH_SIZE = 64
+
+DEFAULT_MATRIX = [
+    {"items": 100, "basket": 10, "scans": 2000, "rate": 0, "remove_ratio": 0.1, "storage": "json"},
+    {"items": 10000, "basket": 30, "scans": 2000, "rate": 0, "remove_ratio": 0.1, "storage": "json"},
+    {"items": 10000, "basket": 30, "scans": 2000, "rate": 0, "remove_ratio": 0.1, "storage": "sqlite"},
+    {"items": 100000, "basket": 50, "scans": 2000, "rate": 0, "remove_ratio": 0.2, "storage": "sqlite"},
+    {"items": 10000, "basket": 30, "scans": 1000, "rate": 100, "remove_ratio": 0.1, "storage": "json"},
+]
+
+# Metrics where a higher number is worse
+HIGHER_IS_WORSE = ("p50_ms", "p99_ms", "bytes_per_scan", "peak_rss_kb")
+
+
+def make_catalog(directory, items, storage_kind, inventory_source=None):
+    # Synthetic "Item N" catalog, or a copy of a real inventory file for recorded traces
+    if inventory_source:
+        with open(inventory_source, "r") as file:
+            inventory = json.load(file)
+    else:
+        inventory = [{
+            "item_code": f"{i:06d}",
+            "item_name": f"Item {i}",
+            "quantity": 1000000,
+            "price_per_quantity": round(1 + (i % 500) * 0.25, 2)
+        } for i in range(items)]
+    inventory_path = os.path.join(directory, "inventory.json")
+    bill_path = os.path.join(directory, "bill.json")
+    write_json_atomic(inventory_path, inventory)
+    write_json_atomic(bill_path, [])
+
+    db_path = os.path.join(directory, "smart_cart.db")
+    storage = open_storage(storage_kind, db_path, inventory_path, bill_path)
+    if storage_kind == "sqlite":
+        storage.import_json(inventory_path, bill_path)
+    return storage, [entry["item_name"] for entry in inventory]
+
+
+def synthetic_trace(names, basket, scans, rate, remove_ratio, seed=1):
+    # A basket of `basket` distinct items is scanned over and over; some scans are removals
+    rng = random.Random(seed)
+    basket_names = rng.sample(names, min(basket, len(names)))
+    interval = 1.0 / rate if rate else 0.0
+    trace = []
+    for i in range(scans):
+        operation = "-" if rng.random() < remove_ratio else "+"
+        trace.append((i * interval, f"{operation},{rng.choice(basket_names)}".encode()))
+    return trace
+
+
+def load_trace(path):
+    trace = []
+    with open(path, "r") as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                trace.append((float(entry["t"]), entry["payload"].encode()))
+    return trace
+
+
+def bytes_written():
+    # Linux only: bytes this process has passed to write() so far
+    try:
+        with open("/proc/self/io", "r") as file:
+            for line in file:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_scenario(scenario, trace_path=None, tk_render=False):
+    directory = tempfile.mkdtemp(prefix="cart-bench-")
+    try:
+        storage, names = make_catalog(directory, scenario["items"], scenario["storage"], scenario.get("inventory"))
+        catalog = Catalog(storage)
+        catalog.load()
+        bill = Bill(storage)
+        cart = Cart(catalog, bill)
+        if trace_path:
+            trace = load_trace(trace_path)
+        else:
+            trace = synthetic_trace(names, scenario["basket"], scenario["scans"], scenario["rate"], scenario["remove_ratio"])
+
+        render_times = []
+        if tk_render:
+            attach_bill_table(bill, render_times)
+
+        queue = ScanQueue(maxsize=len(trace) + 1)
+        enqueued_at = {}  # id(event) -> enqueue time
+        latencies = []
+        statuses = Counter()
+        done = threading.Event()
+
+        def produce():
+            # Plays the role of paho's on_message: parse and enqueue at the trace's pace
+            start = time.perf_counter()
+            for offset, payload in trace:
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                _, events = parse_payload(payload)
+                for event in events:
+                    enqueued_at[id(event)] = time.perf_counter()
+                    queue.put(event)
+            done.set()
+
+        written_before = bytes_written()
+        started = time.perf_counter()
+        producer = threading.Thread(target=produce)
+        producer.start()
+
+        # Plays the role of BillApp.pump_scans
+        while not (done.is_set() and len(queue) == 0):
+            batch = queue.drain(BATCH_SIZE)
+            if not batch:
+                time.sleep(PUMP_INTERVAL)
+                continue
+            with catalog.transaction():
+                for event in coalesce(batch):
+                    scan = cart.apply(event)
+                    if scan:
+                        statuses[scan.status] += 1
+            applied = time.perf_counter()
+            latencies.extend(applied - enqueued_at.pop(id(event)) for event in batch)
+            if len(queue) == 0 and not done.is_set():
+                time.sleep(PUMP_INTERVAL)
+
+        producer.join()
+        storage.flush()
+        elapsed = time.perf_counter() - started
+        written_after = bytes_written()
+        storage.close()
+
+        result = dict(scenario)
+        if trace_path:
+            result["trace"] = trace_path
+        result.update({
+            "events": len(latencies),
+            "events_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "bytes_per_scan": round((written_after - written_before) / len(latencies), 1) if written_before is not None and latencies else None,
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "statuses": dict(statuses)
+        })
+        if render_times:
+            result["render_p50_ms"] = round(percentile(render_times, 0.50) * 1000, 3)
+            result["render_p99_ms"] = round(percentile(render_times, 0.99) * 1000, 3)
+        return result
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def attach_bill_table(bill, render_times):
+    # Times BillTable's reaction to each bill change, under a real (possibly virtual) display
+    import tkinter as tk
+    from types import SimpleNamespace
+    from bill_view import BillTable
+
+    root = tk.Tk()
+    app = SimpleNamespace(
+        normal_font=("Arial", 8, "bold"), bg_color="#2e2e2e", fg_color="white", button_bg="#555555",
+        table_header_bg="#3e3e3e", table_row1_bg="#3e3e3e", table_row2_bg="#2e2e2e")
+    table = BillTable(app, root, bill, lambda: None)
+    bill.unsubscribe(table.on_bill_changed)
+
+    def timed(item_code):
+        start = time.perf_counter()
+        table.on_bill_changed(item_code)
+        root.update_idletasks()  # Include geometry/redraw work in the measurement
+        render_times.append(time.perf_counter() - start)
+
+    bill.subscribe(timed)
+
+
+def run_isolated(scenario, trace_path, tk_render):
+    # Each scenario runs in its own process so peak RSS belongs to that scenario alone
+    command = [sys.executable, os.path.abspath(__file__), "--single", json.dumps(scenario)]
+    if trace_path:
+        command += ["--trace", trace_path]
+    if tk_render:
+        command.append("--tk")
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def scenario_name(result):
+    name = f"{result['storage']}/items={result['items']}/basket={result['basket']}/rate={result['rate']}/remove={result['remove_ratio']}"
+    if result.get("trace"):
+        name += f"/trace={os.path.basename(result['trace'])}"
+    return name
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path, "r") as file:
+        baseline = {scenario_name(entry): entry for entry in json.load(file)["results"]}
+
+    regressions = 0
+    for result in results:
+        old = baseline.get(scenario_name(result))
+        if not old:
+            continue
+        checks = [(metric, True) for metric in HIGHER_IS_WORSE] + [("events_per_s", False)]
+        for metric, higher_is_worse in checks:
+            before, after = old.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            if worse:
+                regressions += 1
+                print(f"REGRESSION {scenario_name(result)} {metric}: {before} -> {after} ({change:+.0%})")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'scenario':<60} {'ev/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'B/scan':>9} {'RSS KB':>9}")
+    for result in results:
+        print(f"{scenario_name(result):<60} {result['events_per_s']:>9} {result['p50_ms']:>8} {result['p99_ms']:>8} "
+              f"{result['bytes_per_scan'] if result['bytes_per_scan'] is not None else '-':>9} {result['peak_rss_kb']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay benchmark for the scan -> bill pipeline")
+    parser.add_argument("--items", type=int, help="catalog size")
+    parser.add_argument("--basket", type=int, default=30, help="distinct items scanned")
+    parser.add_argument("--scans", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=0, help="scans per second, 0 = as fast as possible")
+    parser.add_argument("--remove-ratio", type=float, default=0.1, help="fraction of scans that are removals")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--trace", help="replay a recorded JSON lines trace instead of a synthetic one")
+    parser.add_argument("--inventory", default="inventory.json", help="inventory a recorded trace is replayed against")
+    parser.add_argument("--tk", action="store_true", help="also time BillTable redraws (needs DISPLAY, e.g. xvfb-run)")
+    parser.add_argument("--save", help="write results to this JSON baseline file")
+    parser.add_argument("--compare", help="compare against a saved baseline and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed change before a metric counts as a regression")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_scenario(json.loads(args.single), args.trace, args.tk)))
+        sys.exit(0)
+
+    if args.trace:
+        with open(args.inventory, "r") as file:
+            items = len(json.load(file))
+        scenarios = [{"items": items, "basket": args.basket, "scans": args.scans, "rate": args.rate,
+                      "remove_ratio": args.remove_ratio, "storage": args.storage, "inventory": os.path.abspath(args.inventory)}]
+    elif args.items:
+        scenarios = [{"items": args.items, "basket": args.basket, "scans": args.scans, "rate": args.rate,
+                      "remove_ratio": args.remove_ratio, "storage": args.storage}]
+    else:
+        scenarios = DEFAULT_MATRIX
+
+    results = [run_isolated(scenario, args.trace, args.tk) for scenario in scenarios]
+    print_table(results)
+    for result in results:
+        missed = result["statuses"].get("not_found", 0)
+        if missed:
+            print(f"Warning: {scenario_name(result)}: {missed} scans named items that are not in the catalog")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as file:
+            json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"), "python": sys.version.split()[0], "results": results}, file, indent=4)
+        print("Saved baseline to", args.save)
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
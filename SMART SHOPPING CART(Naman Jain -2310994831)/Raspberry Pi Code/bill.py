@@ -0,0 +1,123 @@
+from pricing import PricingEngine, to_paise
+
+
+class BillLine:
+    __slots__ = ("item_code", "item_name", "cost_per_unit", "quantity")
+
+    def __init__(self, item_code, item_name, cost_per_unit, quantity):
+        self.item_code = item_code
+        self.item_name = item_name
+        self.cost_per_unit = cost_per_unit
+        self.quantity = quantity
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["item_code"], data["item_name"], data["cost_per_unit"], data["quantity"])
+
+    def to_dict(self):
+        return {
+            "item_code": self.item_code,
+            "item_name": self.item_name,
+            "cost_per_unit": self.cost_per_unit,
+            "quantity": self.quantity
+        }
+
+
+class Bill:
+    """In-memory bill for the current customer, persisted through a storage backend
+
+    Pass storage=None for a bill that only lives in memory (the multi-cart server keeps one per cart).
+    Totals come from a PricingEngine in integer paise, updated for the changed line only.
+    """
+
+    def __init__(self, storage=None, pricing=None):
+        self.storage = storage
+        self.lines = {}  # item_code -> BillLine, kept in the order items were first added
+        self.pricing = PricingEngine(pricing)  # Running subtotal, discounts and tax for these lines
+        self.listeners = []  # Called with the changed item_code, or None when the whole bill changed
+
+    @property
+    def total(self):
+        # Amount to pay, in paise
+        return self.pricing.total
+
+    def reprice(self):
+        self.pricing.reset()
+        for line in self.lines.values():
+            self.pricing.update(line.item_code, line.quantity, to_paise(line.cost_per_unit))
+
+    def load(self):
+        self.lines = {line.item_code: line for line in self.storage.load_bill()}
+        self.reprice()
+        self._changed(None)
+
+    def replace(self, entries, priced=None):
+        # Swap in a whole bill, e.g. a snapshot published by the cart server; priced is that
+        # server's PricingEngine.export(), and the bill then shows its totals rather than our own
+        self.lines = {entry["item_code"]: BillLine.from_dict(entry) for entry in entries}
+        self.reprice()
+        if priced is not None:
+            self.pricing.adopt(priced)
+        if self.storage:
+            self.storage.replace_bill(self)
+        self._changed(None)
+
+    def to_list(self):
+        return [line.to_dict() for line in list(self.lines.values())]
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _changed(self, item_code):
+        for listener in list(self.listeners):
+            listener(item_code)
+
+    def get(self, item_code):
+        return self.lines.get(item_code)
+
+    def find(self, item_name):
+        # A basket only holds a handful of lines, so a scan here is cheap
+        item_name = item_name.lower()
+        return next((line for line in self.lines.values() if line.item_name.lower() == item_name), None)
+
+    def add(self, catalog_item, quantity=1):
+        bill_line = self.lines.get(catalog_item.item_code)
+        if bill_line:
+            bill_line.quantity += quantity
+        else:
+            bill_line = BillLine(catalog_item.item_code, catalog_item.item_name, catalog_item.price_per_quantity, quantity)
+            self.lines[catalog_item.item_code] = bill_line
+        self.pricing.update(bill_line.item_code, bill_line.quantity, to_paise(bill_line.cost_per_unit))
+        self.save(bill_line)
+        self._changed(bill_line.item_code)
+        return bill_line
+
+    def remove(self, bill_line, quantity=1):
+        # Returns how many units were actually taken off the bill
+        removed = min(quantity, bill_line.quantity)
+        bill_line.quantity -= removed
+        if bill_line.quantity == 0:
+            del self.lines[bill_line.item_code]  # Remove the item if quantity reaches zero
+        self.pricing.update(bill_line.item_code, bill_line.quantity, to_paise(bill_line.cost_per_unit))
+        self.save(bill_line)
+        self._changed(bill_line.item_code)
+        return removed
+
+    def clear(self):
+        self.lines = {}
+        self.pricing.reset()
+        if self.storage:
+            self.storage.clear_bill()
+        self._changed(None)
+
+    def save(self, line):
+        if self.storage:
+            self.storage.save_bill_line(self, line)
+
+    def flush(self):
+        if self.storage:
+            self.storage.flush()
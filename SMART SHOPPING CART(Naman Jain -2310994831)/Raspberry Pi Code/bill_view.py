@@ -0,0 +1,110 @@
+import tkinter as tk
+
+from metrics import METRICS
+from pricing import format_paise
+
+
+class BillTable:
+    """Bill table that keeps one row of Labels per item_code and only touches rows that changed"""
+
+    FIRST_ROW = 4  # Grid row of the first bill line (headers sit on row 2)
+
+    def __init__(self, app, window, bill, on_checkout):
+        self.app = app
+        self.window = window
+        self.bill = bill
+        self.rows = {}  # item_code -> [code, name, quantity, price, total] Labels
+        self.spare_rows = []  # Rows of removed items, kept for reuse instead of destroyed
+
+        # Add table headers
+        headers = [("Item Code", 15), ("Item Name", 20), ("Quantity", 20), ("Price per Unit", 20), ("Total Price", 20)]
+        for column, (text, width) in enumerate(headers):
+            tk.Label(window, text=text, font=app.normal_font, width=width, anchor='w', bg=app.table_header_bg, fg=app.fg_color).grid(row=2, column=column, padx=10, pady=10, sticky='w')
+
+        # Total sum and "Checkout" button, moved below the last row whenever rows come and go
+        self.total_caption = tk.Label(window, text="Total Sum:", font=app.normal_font, width=20, anchor='e', bg=app.bg_color, fg=app.fg_color)
+        self.total_label = tk.Label(window, font=app.normal_font, width=20, anchor='w', bg=app.bg_color, fg=app.fg_color)
+        self.savings_label = tk.Label(window, font=app.normal_font, anchor='w', bg=app.bg_color, fg=app.fg_color)
+        self.checkout_button = tk.Button(window, text="Checkout", bg=app.button_bg, fg=app.fg_color, font=app.normal_font, command=on_checkout)
+
+        self.bill.subscribe(self.on_bill_changed)
+        window.bind("<Destroy>", self.on_destroy, add="+")
+        self.on_bill_changed(None)
+
+    def on_destroy(self, event):
+        if event.widget is self.window:
+            self.bill.unsubscribe(self.on_bill_changed)
+
+    def on_bill_changed(self, item_code):
+        with METRICS.span("render"):
+            self.sync_rows(item_code)
+
+    def sync_rows(self, item_code):
+        if item_code is None:
+            # Whole bill replaced (load/clear): sync every row
+            for code in list(self.rows):
+                if code not in self.bill.lines:
+                    self.release_row(code)
+            for code, line in self.bill.lines.items():
+                self.update_row(line)
+            self.layout()
+        else:
+            line = self.bill.get(item_code)
+            if line is None:
+                self.release_row(item_code)
+                self.layout()
+            elif item_code in self.rows:
+                # Quantity change only: update the two Labels that depend on it
+                self.update_row(line)
+            else:
+                self.update_row(line)
+                self.layout()
+
+        # Totals are kept in paise by the bill's pricing engine; nothing is re-summed here
+        pricing = self.bill.pricing
+        self.total_label.config(text=f"₹ {format_paise(pricing.total)}")
+        savings = []
+        if pricing.discount:
+            savings.append(f"You save: ₹ {format_paise(pricing.discount)}")
+        if pricing.tax:
+            savings.append(f"{'Incl. tax' if pricing.prices_include_tax else 'Tax'}: ₹ {format_paise(pricing.tax)}")
+        self.savings_label.config(text="   ".join(savings))
+
+    def update_row(self, line):
+        labels = self.rows.get(line.item_code)
+        if labels is None:
+            labels = self.spare_rows.pop() if self.spare_rows else self.create_row()
+            self.rows[line.item_code] = labels
+            labels[0].config(text=line.item_code)
+            labels[1].config(text=line.item_name)
+            labels[3].config(text=f"₹ {line.cost_per_unit:.2f}")
+        labels[2].config(text=f"{line.quantity}")
+        labels[4].config(text=f"₹ {format_paise(self.bill.pricing.line_net(line.item_code))}")
+
+    def create_row(self):
+        app = self.app
+        widths = [15, 20, 15, 20, 20]
+        return [tk.Label(self.window, font=app.normal_font, width=width, fg=app.fg_color, relief="solid", padx=10, pady=5, anchor='w') for width in widths]
+
+    def release_row(self, item_code):
+        labels = self.rows.pop(item_code, None)
+        if labels:
+            for label in labels:
+                label.grid_remove()
+            self.spare_rows.append(labels)
+
+    def layout(self):
+        # Re-grid rows in bill order; no widgets are created or destroyed here
+        row = self.FIRST_ROW
+        for code in self.bill.lines:
+            labels = self.rows[code]
+            row_color = self.app.table_row1_bg if (row - self.FIRST_ROW) % 2 == 0 else self.app.table_row2_bg
+            for column, label in enumerate(labels):
+                label.config(bg=row_color)
+                label.grid(row=row, column=column, padx=1, pady=1, sticky='w')
+            row += 1
+
+        self.savings_label.grid(row=row, column=0, columnspan=3, padx=10, pady=5, sticky="w")
+        self.total_caption.grid(row=row, column=3, padx=10, pady=5, sticky="e")
+        self.total_label.grid(row=row, column=4, padx=10, pady=5, sticky="w")
+        self.checkout_button.grid(row=row + 1, column=0, columnspan=5, pady=5)
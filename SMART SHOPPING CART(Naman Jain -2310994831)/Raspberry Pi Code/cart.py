@@ -0,0 +1,90 @@
+from collections import namedtuple
+
+from metrics import METRICS
+from protocol import describe_key
+
+# Outcome of one scan. status is one of "added", "removed", "out_of_stock", "not_found",
+# "not_in_bill" or "restocked"; quantity is how many units actually changed hands
+ScanResult = namedtuple("ScanResult", ["status", "item", "quantity"])
+
+RESTOCK_AMOUNT = 10  # What the "Inventory" card adds to every item
+
+
+class Cart:
+    """Bill and inventory rules for one cart, with no UI attached
+
+    Several carts can share one Catalog; every stock check-and-decrement happens
+    under the catalog lock and inside one storage transaction together with the
+    bill change, so two carts can never take the same last unit and a crash
+    never leaves stock and bill disagreeing.
+    """
+
+    def __init__(self, catalog, bill):
+        self.catalog = catalog
+        self.bill = bill
+
+    def resolve(self, event):
+        # Returns (display name, catalog item or None if it still needs a name lookup)
+        if event.kind == "name":
+            return event.item, None
+        # Binary scans carry an item code or RFID UID; resolve it straight from the raw-key index
+        with METRICS.span("lookup"):
+            inventory_item = self.catalog.resolve(event)
+        item = inventory_item.item_name if inventory_item else describe_key(event.item, event.kind)
+        return item, inventory_item
+
+    def apply(self, event):
+        item, inventory_item = self.resolve(event)
+        if event.operation == "-" and item != "Inventory":
+            result = self.remove(item, event.count, inventory_item)
+        elif event.operation == "+" and item != "Inventory":
+            result = self.add(item, event.count, inventory_item)
+        elif event.operation == "+" and item == "Inventory":
+            result = self.restock_all()
+        else:
+            return None
+        METRICS.inc("scans", status=result.status)
+        METRICS.log("scan", status=result.status, item=result.item, quantity=result.quantity, requested=event.count)
+        return result
+
+    def add(self, item_name, quantity=1, item_details=None):
+        # Find item in inventory
+        if item_details is None:
+            with METRICS.span("lookup"):
+                item_details = self.catalog.find(item_name)
+        if not item_details:
+            return ScanResult("not_found", item_name, 0)
+
+        with self.catalog.lock, self.catalog.transaction():
+            # Decrease inventory quantity; take what is left if a batch asks for more than is in stock
+            added = self.catalog.take(item_details, quantity)
+            if added:
+                # Add the item to the bill (or bump its quantity)
+                self.bill.add(item_details, added)
+
+        if added < quantity:
+            return ScanResult("out_of_stock", item_name, added)
+        return ScanResult("added", item_name, added)
+
+    def remove(self, item, quantity=1, inventory_item=None):
+        # Find the item in the bill
+        with METRICS.span("lookup"):
+            if inventory_item is None:
+                inventory_item = self.catalog.find(item)
+            bill_item = self.bill.get(inventory_item.item_code) if inventory_item else self.bill.find(item)
+        if not bill_item:
+            return ScanResult("not_in_bill", item, 0)
+
+        # Put the item back in the inventory, then decrement its quantity in the bill
+        # (stock first, so bill listeners such as the session journal see the final stock)
+        with self.catalog.lock, self.catalog.transaction():
+            removed = min(quantity, bill_item.quantity)
+            if inventory_item:
+                self.catalog.put_back(inventory_item, removed)
+            self.bill.remove(bill_item, removed)
+        return ScanResult("removed", item, removed)
+
+    def restock_all(self, amount=RESTOCK_AMOUNT):
+        # Increment each item's quantity
+        self.catalog.restock_all(amount)
+        return ScanResult("restocked", "Inventory", amount)
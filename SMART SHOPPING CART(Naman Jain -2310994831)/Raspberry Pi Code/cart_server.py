@@ -0,0 +1,431 @@
+import argparse
+import asyncio
+import json
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from bill import Bill
+from cart import Cart
+from catalog import Catalog
+from ingest import ScanFilter, coalesce
+from metrics import METRICS, serve_metrics
+from pricing import load_rules
+from sales_log import SalesLog
+from mqtt_link import MqttLink, install_id
+from protocol import parse_payload, FrameError, SCAN_TOPIC, BILL_TOPIC, RESTOCK_TOPIC
+from restock import RestockVerifier, apply_restock, parse_message, restock_secret
+from storage import open_storage
+
+CART_QUEUE_SIZE = 256  # Max scans waiting per cart before new ones are dropped
+REPEAT_WINDOW = 1.5  # Seconds a repeated read of the same tag on one cart is ignored
+RATE_LIMIT = 10  # Scans per second per cart on average
+RATE_BURST = 20  # Max scans per cart at once
+BATCH_SIZE = 64  # Max scans applied per cart per pass
+GROUP_SIZE = 32  # Max cart batches committed together
+STATS_INTERVAL = 30  # Seconds between status prints (and inventory change checks)
+MAX_CARTS = 500  # Default sessions held at once; scans for further carts are refused
+IDLE_TIMEOUT = 15 * 60  # Seconds before a quiet cart with an empty bill gives its session back
+
+RESET = object()  # Queue marker: the cart finished its session, start a fresh bill
+
+
+class CartSession:
+    """One cart's isolated bill plus its scan queue"""
+
+    def __init__(self, cart_id, catalog, pricing=None):
+        self.cart_id = cart_id
+        self.bill = Bill(pricing=pricing)  # Lives in memory only; the cart UI mirrors the snapshots we publish
+        self.cart = Cart(catalog, self.bill)
+        self.queue = asyncio.Queue(CART_QUEUE_SIZE)
+        self.version = 0
+        self.dropped = 0
+        self.task = None
+        self.busy = False  # A batch is with the writer thread, which owns the bill until it is back
+        self.last_active = time.monotonic()
+
+
+class BatchJob:
+    """One cart's batch on its way through the writer thread"""
+
+    def __init__(self, session, batch):
+        self.session = session
+        self.batch = batch
+        self.future = Future()
+        self.results = []
+        self.saved_bill = None  # The bill before the batch, put back if the batch is not saved
+        self.saved_stock = {}  # CatalogItem -> quantity before the batch, for each item it touches
+
+
+class CartServer:
+    """Headless billing for many carts sharing one broker and one inventory
+
+    Carts publish scans to RF_SMART_CART_DTS/<cart_id> (text or binary frames) and
+    RF_SMART_CART_DTS/<cart_id>/reset when a session ends. After each batch the server
+    publishes the cart's bill, retained, to RF_SMART_CART_BILL/<cart_id>. With a
+    default_cart, scans on the bare RF_SMART_CART_DTS (a sketch with no cart_id set) go
+    to that cart. Only numeric cart ids (or the ones passed as cart_ids) get a session,
+    at most max_carts of them, and a cart that sits idle with an empty bill gives its
+    session back.
+
+    paho delivers messages on its network thread; they are handed to the asyncio loop
+    and each cart gets its own task, which sends one batch at a time to the writer, so
+    scans of a single cart are applied in order. The writer is the one thread that
+    touches storage: it takes the batches waiting from every cart and commits them in
+    one transaction (group commit), so the loop never waits on a commit and carts
+    share the cost of each one. Stock is shared, and Cart does every check-and-decrement
+    under the catalog lock. If a commit fails, only the bills and items its batches
+    touched are put back.
+    """
+
+    def __init__(self, catalog, host, port, client_factory=None, pricing=None, sales_log=None, client_id=None, cart_ids=None, restock_secret=None,
+                 max_carts=MAX_CARTS, default_cart=None):
+        self.catalog = catalog
+        self.default_cart = default_cart  # Cart that scans on the bare SCAN_TOPIC belong to; None ignores them
+        self.max_carts = max_carts
+        self.cart_ids = set(cart_ids) if cart_ids else None  # Carts we serve; None = any numeric id
+        self.pricing = pricing  # PricingRules shared by every cart's bill
+        self.sales_log = sales_log  # Where finished bills go when a cart is reset
+        self.sessions = {}  # cart_id -> CartSession
+        self.refused = 0  # Messages for unknown carts, or new carts while full
+        self.loop = None
+        self.jobs = queue.SimpleQueue()  # BatchJob, (future, fn, args) or None to stop the writer
+        self.writer = threading.Thread(target=self.write_batches, daemon=True, name="cart-writer")
+        self.results = Counter()  # Scan outcomes across all carts
+        self.scan_filter = ScanFilter(REPEAT_WINDOW, RATE_LIMIT, RATE_BURST)
+        self.restock_verifier = RestockVerifier(restock_secret) if restock_secret else None  # None: restocks over MQTT are off
+        topics = [f"{SCAN_TOPIC}/+/#"]
+        if default_cart:
+            topics.append(SCAN_TOPIC)
+        if self.restock_verifier:
+            topics.append(RESTOCK_TOPIC)
+        self.mqtt = MqttLink(host, port, topics, self.on_message,
+                             client_id=client_id or f"smart-cart-server-{install_id()}", client_factory=client_factory)
+        METRICS.gauge("carts", lambda: len(self.sessions))
+        METRICS.gauge("scan_queue_dropped", lambda: sum(session.dropped for session in list(self.sessions.values())))
+        METRICS.gauge("scans_suppressed_duplicate", lambda: self.scan_filter.duplicates)
+        METRICS.gauge("scans_suppressed_rate_limited", lambda: self.scan_filter.rate_limited)
+        METRICS.gauge("mqtt_connects", lambda: self.mqtt.connects)
+        METRICS.gauge("mqtt_reconnects", lambda: self.mqtt.reconnects)
+        METRICS.gauge("mqtt_duplicates", lambda: self.mqtt.duplicates)
+
+    async def run(self):
+        self.start()
+        try:
+            while True:
+                await asyncio.sleep(STATS_INTERVAL)
+                await self.call(self.catalog.reload_if_changed)
+                self.reap_idle()
+                print("Cart server:", self.stats())
+        finally:
+            self.stop()
+            self.catalog.storage.close()
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.writer.start()
+        self.mqtt.start()
+
+    def stop(self):
+        self.mqtt.stop()
+        self.jobs.put(None)  # The writer saves what is queued ahead of this, then exits
+        self.writer.join()
+
+    def stats(self):
+        return {
+            "carts": len(self.sessions),
+            "refused": self.refused,
+            "dropped": sum(session.dropped for session in self.sessions.values()),
+            "filtered": self.scan_filter.stats(),
+            "results": dict(self.results),
+            "mqtt": self.mqtt.status()
+        }
+
+    def on_message(self, client, userdata, msg):
+        # paho network thread: hand the message over to the event loop untouched
+        self.loop.call_soon_threadsafe(self.dispatch, msg.topic, msg.payload)
+
+    def dispatch(self, topic, payload):
+        if topic == RESTOCK_TOPIC:
+            asyncio.ensure_future(self.restock(payload))
+            return
+
+        # Topic is RF_SMART_CART_DTS/<cart_id>[/<command>], or bare RF_SMART_CART_DTS for the default cart
+        parts = topic.split("/")
+        if len(parts) == 1 and self.default_cart:
+            parts.append(self.default_cart)
+        if len(parts) < 2 or not parts[1]:
+            return
+        cart_id = parts[1]
+        command = parts[2] if len(parts) > 2 else "scan"
+        session = self.session(cart_id)
+        if session is None:
+            return
+
+        if command == "reset":
+            self.enqueue(session, RESET)
+            return
+        if command != "scan":
+            print(f"Cart {cart_id}: unknown command '{command}'")
+            return
+
+        try:
+            with METRICS.span("parse"):
+                _, events = parse_payload(payload)
+        except FrameError as e:
+            print(f"Cart {cart_id}: ignoring bad scan: {e}")
+            METRICS.inc("bad_frames")
+            return
+        METRICS.inc("scan_events", len(events))
+        for event in events:
+            if event.seq is not None and self.mqtt.seen_seq(cart_id, event.seq):
+                continue
+            if self.scan_filter.suppress(cart_id, event):
+                continue
+            self.enqueue(session, event)
+
+    def enqueue(self, session, event):
+        try:
+            session.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            session.dropped += 1
+
+    def accepts(self, cart_id):
+        # Anyone can publish on the broker, so only known carts get a session
+        if cart_id == self.default_cart:
+            return True
+        if self.cart_ids is not None:
+            return cart_id in self.cart_ids
+        return cart_id.isdigit() and int(cart_id) < 65536
+
+    def session(self, cart_id):
+        # Returns the cart's session, starting one if needed, or None if the cart is refused
+        session = self.sessions.get(cart_id)
+        if session is None:
+            if not self.accepts(cart_id) or (len(self.sessions) >= self.max_carts and not self.reap_idle()):
+                self.refused += 1
+                METRICS.inc("carts_refused")
+                return None
+            session = CartSession(cart_id, self.catalog, self.pricing)
+            session.task = asyncio.ensure_future(self.serve_cart(session))
+            self.sessions[cart_id] = session
+            print(f"Cart {cart_id}: new session")
+        return session
+
+    async def serve_cart(self, session):
+        while True:
+            batch = [await session.queue.get()]
+            while len(batch) < BATCH_SIZE and not session.queue.empty():
+                batch.append(session.queue.get_nowait())
+            job = BatchJob(session, batch)
+            session.busy = True
+            self.jobs.put(job)
+            try:
+                results = await asyncio.wrap_future(job.future)
+            finally:
+                session.busy = False
+                session.last_active = time.monotonic()
+            self.results.update(result.status for result in results)
+            self.publish_bill(session, results)
+
+    def call(self, fn, *args):
+        # Runs fn on the writer thread, after the batches queued before it; returns an awaitable of its result
+        future = Future()
+        self.jobs.put((future, fn, args))
+        return asyncio.wrap_future(future)
+
+    def reap_idle(self, now=None):
+        # Ends the sessions of carts that went quiet with an empty bill; returns how many
+        now = time.monotonic() if now is None else now
+        idle = [cart_id for cart_id, session in self.sessions.items()
+                if not session.busy and not session.bill.lines and session.queue.empty() and now - session.last_active > IDLE_TIMEOUT]
+        for cart_id in idle:
+            self.sessions.pop(cart_id).task.cancel()
+            print(f"Cart {cart_id}: session ended (idle)")
+        return len(idle)
+
+    def write_batches(self):
+        # Writer thread: everything that touches storage runs here, one thing at a time
+        while True:
+            jobs = [self.jobs.get()]
+            while len(jobs) < GROUP_SIZE:
+                try:
+                    jobs.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+            group = []
+            for job in jobs:
+                if isinstance(job, BatchJob):
+                    if job.future.set_running_or_notify_cancel():  # False if the cart's task was cancelled
+                        group.append(job)
+                    continue
+                # A restock, a reload or the stop marker runs on its own, after the batches ahead of it
+                self.commit_group(group)
+                group = []
+                if job is None:
+                    return
+                self.run_call(*job)
+            self.commit_group(group)
+
+    def run_call(self, future, fn, args):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+    def commit_group(self, group):
+        # One storage commit for the waiting batches of every cart in the group
+        if not group:
+            return
+        with METRICS.span("batch"):
+            try:
+                with self.catalog.transaction():
+                    for job in group:
+                        self.apply_batch(job)
+            except Exception as e:
+                # BEGIN or COMMIT failed (e.g. "database is locked"): none of the group was saved,
+                # so put back what each batch changed in memory, newest first
+                print(f"Carts {', '.join(job.session.cart_id for job in group)}: failed to save scans: {e}")
+                for job in reversed(group):
+                    self.roll_back(job)
+        METRICS.inc("commits")
+        for job in group:
+            METRICS.log("scan_batch", cart_id=job.session.cart_id, events=len(job.batch), results=len(job.results), group=len(group))
+            job.future.set_result(job.results)
+
+    def apply_batch(self, job):
+        # Writer thread, inside the group's transaction
+        session = job.session
+        events = []
+
+        def apply_events():
+            for event in coalesce(events):
+                try:
+                    result = session.cart.apply(event)
+                except Exception as e:
+                    print(f"Cart {session.cart_id}: failed to apply scan {event}: {e}")
+                    continue
+                if result:
+                    job.results.append(result)
+            events.clear()
+
+        job.saved_bill = session.bill.to_list()
+        for event in job.batch:
+            if event is not RESET:
+                self.save_stock(job, event)
+        try:
+            # Nested, so a batch that fails on its own is undone without taking the group with it
+            with self.catalog.transaction():
+                for event in job.batch:
+                    if event is RESET:
+                        # Items in a finished bill have left the store, so stock is not returned
+                        apply_events()
+                        self.record_sale(session)
+                        session.bill.clear()
+                        job.saved_bill = []  # The sale is recorded either way; never bring that bill back
+                    else:
+                        events.append(event)
+                apply_events()
+        except Exception as e:
+            print(f"Cart {session.cart_id}: failed to apply batch: {e}")
+            self.roll_back(job)
+
+    def save_stock(self, job, event):
+        # Remember the stock of the item a scan can change, so a failed commit only has to put back that
+        if event.kind == "name" and event.item == "Inventory":
+            items = self.catalog.items  # The restock card adds to every item
+        else:
+            item = self.catalog.resolve(event)
+            items = [item] if item else []
+        for item in items:
+            job.saved_stock.setdefault(item, item.quantity)
+
+    def roll_back(self, job):
+        # Storage already dropped the batch; make memory agree with it again
+        if job.saved_bill is None:
+            return
+        with self.catalog.lock:
+            for item, quantity in job.saved_stock.items():
+                item.quantity = quantity
+        job.session.bill.replace(job.saved_bill)
+        job.results = []
+
+    def record_sale(self, session):
+        if self.sales_log is None or not session.bill.lines:
+            return
+        # The log stores a numeric cart id; named carts are logged as cart 0
+        cart_number = int(session.cart_id) if session.cart_id.isdigit() and int(session.cart_id) < 65536 else 0
+        try:
+            self.sales_log.record_sale(session.bill, cart_number)
+        except OSError as e:
+            print(f"Cart {session.cart_id}: failed to record sale: {e}")
+
+    async def restock(self, payload):
+        # Stock is shared by every cart, so one batch here is seen by all of them
+        if self.restock_verifier is None:
+            return
+        try:
+            body = self.restock_verifier.verify(payload)
+        except ValueError as e:
+            print("Ignoring restock:", e)
+            return
+        try:
+            report = await self.call(apply_restock, self.catalog, parse_message(body))
+        except Exception as e:
+            print("Failed to apply restock:", e)
+            return
+        print("Restock:", report)
+        self.mqtt.publish(f"{RESTOCK_TOPIC}/result", json.dumps(report.to_dict()))
+
+    def publish_bill(self, session, results):
+        session.version += 1
+        snapshot = {
+            "cart_id": session.cart_id,
+            "version": session.version,
+            "total_paise": session.bill.total,
+            "pricing": session.bill.pricing.export(),
+            "lines": session.bill.to_list(),
+            "results": [list(result) for result in results]
+        }
+        self.mqtt.publish(f"{BILL_TOPIC}/{session.cart_id}", json.dumps(snapshot), retain=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve many smart carts from one process")
+    parser.add_argument("--host", default="broker.emqx.io")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--carts", help="comma-separated cart ids to serve (default: any numeric id)")
+    parser.add_argument("--max-carts", type=int, default=MAX_CARTS, help="carts served at once (default: %(default)s)")
+    parser.add_argument("--default-cart", help="cart id for scans on the bare scan topic (a sketch with no cart_id set)")
+    parser.add_argument("--client-id", help="MQTT client id (default: smart-cart-server-<id kept in mqtt_client_id>)")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--db", default="smart_cart.db")
+    parser.add_argument("--inventory", default="inventory.json")
+    parser.add_argument("--promotions", default="promotions.json")
+    parser.add_argument("--sales", default="sales", help="directory of the sales log")
+    parser.add_argument("--metrics-port", type=int, help="serve /metrics and /metrics.json on localhost")
+    parser.add_argument("--json-logs", action="store_true", help="print one JSON line per scan and batch")
+    args = parser.parse_args()
+
+    if args.metrics_port is not None or args.json_logs:
+        METRICS.enable(json_logs=args.json_logs)
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_port)
+
+    storage = open_storage(args.storage, args.db, args.inventory)
+    if not storage.claim():
+        parser.error(f"{args.inventory} is in use by another cart app or cart server")
+    catalog = Catalog(storage)
+    catalog.load()
+    server = CartServer(catalog, args.host, args.port, pricing=load_rules(args.promotions), sales_log=SalesLog(args.sales),
+                        client_id=args.client_id, cart_ids=args.carts.split(",") if args.carts else None,
+                        restock_secret=restock_secret(), max_carts=args.max_carts,
+                        default_cart=args.default_cart)
+    try:
+        asyncio.run(server.run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,197 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+
+class CatalogItem:
+    # __slots__ keeps each record small when the catalog holds tens of thousands of SKUs
+    __slots__ = ("item_code", "item_name", "quantity", "price_per_quantity", "rfid_uid")
+
+    def __init__(self, item_code, item_name, quantity, price_per_quantity, rfid_uid=None):
+        self.item_code = item_code
+        self.item_name = item_name
+        self.quantity = quantity
+        self.price_per_quantity = price_per_quantity
+        self.rfid_uid = rfid_uid  # Optional hex UID of the tag, e.g. "93D85F03"
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["item_code"], data["item_name"], data["quantity"], data["price_per_quantity"], data.get("rfid_uid"))
+
+    def to_dict(self):
+        data = {
+            "item_code": self.item_code,
+            "item_name": self.item_name,
+            "quantity": self.quantity,
+            "price_per_quantity": self.price_per_quantity
+        }
+        if self.rfid_uid:
+            data["rfid_uid"] = self.rfid_uid
+        return data
+
+
+def raw_key(key):
+    # Binary scan frames carry item codes and UIDs as NUL padded 8-byte keys
+    return key.ljust(8, b"\0")
+
+
+class SearchIndex:
+    """Precomputed name/code index for the inventory viewer's search box"""
+
+    def __init__(self, items):
+        self.items = items
+        # One lower-cased "name<TAB>code" key per item, in catalog order
+        self.keys = [f"{item.item_name.lower()}\t{item.item_code.lower()}" for item in items]
+
+        # Sorted (key, position) pairs for prefix search
+        self.sorted_names = sorted((item.item_name.lower(), i) for i, item in enumerate(items))
+        self.sorted_codes = sorted((item.item_code.lower(), i) for i, item in enumerate(items))
+
+        # All keys joined into one string so substring search is a handful of C-level str.find calls
+        self.haystack = "\n".join(self.keys)
+        self.line_starts = []
+        offset = 0
+        for key in self.keys:
+            self.line_starts.append(offset)
+            offset += len(key) + 1
+
+    def prefix_matches(self, query, sorted_pairs):
+        start = bisect_left(sorted_pairs, (query,))
+        matches = []
+        for key, i in sorted_pairs[start:]:
+            if not key.startswith(query):
+                break
+            matches.append(i)
+        return matches
+
+    def is_prefix(self, i, query):
+        name, code = self.keys[i].split("\t")
+        return name.startswith(query) or code.startswith(query)
+
+    def search(self, query, within=None):
+        """Returns item positions: prefix matches (alphabetical) first, then other substring matches
+
+        Pass the previous result as `within` when the new query extends the old one,
+        so only that subset is re-checked.
+        """
+        query = query.lower().replace("\t", " ").replace("\n", " ")
+        if not query:
+            return list(range(len(self.items)))
+
+        if within is not None:
+            matches = [i for i in within if query in self.keys[i]]
+            prefixed = [i for i in matches if self.is_prefix(i, query)]
+            prefixed_set = set(prefixed)
+            return prefixed + [i for i in matches if i not in prefixed_set]
+
+        prefixed = self.prefix_matches(query, self.sorted_names)
+        prefixed_set = set(prefixed)
+        for i in self.prefix_matches(query, self.sorted_codes):
+            if i not in prefixed_set:
+                prefixed.append(i)
+                prefixed_set.add(i)
+
+        rest = []
+        last_line = -1
+        position = self.haystack.find(query)
+        while position != -1:
+            line = bisect_right(self.line_starts, position) - 1
+            if line != last_line and line not in prefixed_set:
+                rest.append(line)
+            last_line = line
+            # Skip to the next item, one match per item is enough
+            next_start = self.line_starts[line + 1] if line + 1 < len(self.line_starts) else len(self.haystack)
+            position = self.haystack.find(query, next_start)
+
+        return prefixed + rest
+
+
+class Catalog:
+    """Resident copy of the inventory with hash indexes on item name and item code
+
+    Persistence is delegated to a storage backend (see storage.py).
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.lock = threading.RLock()
+        self.items = []
+        self.by_name = {}  # lower-cased item_name -> CatalogItem
+        self.by_code = {}  # item_code -> CatalogItem
+        self.by_raw_code = {}  # NUL padded item_code bytes -> CatalogItem (binary frames)
+        self.by_raw_uid = {}  # NUL padded RFID UID bytes -> CatalogItem (binary frames)
+        self.search_index = None  # Built on first search, dropped whenever the catalog is reloaded
+
+    def load(self):
+        with self.lock:
+            items = self.storage.load_items()
+            self.items = items
+            self.by_name = {item.item_name.lower(): item for item in items}
+            self.by_code = {item.item_code: item for item in items}
+            self.by_raw_code = {raw_key(item.item_code.encode("ascii")): item for item in items}
+            self.by_raw_uid = {raw_key(bytes.fromhex(item.rfid_uid)): item for item in items if item.rfid_uid}
+            self.search_index = None
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def find(self, item_name):
+        # Case-insensitive lookup by name, O(1)
+        return self.by_name.get(item_name.lower())
+
+    def get(self, item_code):
+        return self.by_code.get(item_code)
+
+    def resolve(self, event):
+        # Look up the item a scan refers to, straight from the raw key for binary scans
+        if event.kind == "code":
+            return self.by_raw_code.get(event.item)
+        if event.kind == "uid":
+            return self.by_raw_uid.get(event.item)
+        return self.find(event.item)
+
+    def get_search_index(self):
+        # Names and codes only change on reload, so the index is reused across searches
+        with self.lock:
+            if self.search_index is None or self.search_index.items is not self.items:
+                self.search_index = SearchIndex(self.items)
+            return self.search_index
+
+    def transaction(self):
+        return self.storage.transaction()
+
+    def take(self, item, quantity):
+        # Returns how many units were actually available and taken
+        with self.lock:
+            return self.storage.take_stock(item, quantity)
+
+    def put_back(self, item, quantity):
+        with self.lock:
+            self.storage.return_stock(item, quantity)
+
+    def restock_all(self, amount):
+        with self.lock:
+            self.storage.restock_all(self.items, amount)
+
+    def adjust(self, item, delta):
+        # Per-SKU stock change from a restock manifest; False if it would take stock below zero
+        with self.lock:
+            return self.storage.adjust_stock(item, delta)
+
+    def set_price(self, item, price):
+        with self.lock:
+            self.storage.set_price(item, price)
+
+    def flush(self):
+        self.storage.flush()
+
+    def reload_if_changed(self):
+        # Pick up inventory changes made outside this process
+        if not self.storage.inventory_changed():
+            return False
+
+        self.load()
+        print("Inventory reloaded")
+        return True
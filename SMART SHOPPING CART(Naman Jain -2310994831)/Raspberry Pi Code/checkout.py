@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from pricing import format_paise
+
+# PIL images, ready to be wrapped in ImageTk.PhotoImage on the Tk thread
+CheckoutImages = namedtuple("CheckoutImages", ["qr", "receipt"])
+
+
+def bill_key(name, contact, bill):
+    # Everything the rendered images depend on; an unchanged bill gives the same key
+    return (name, contact, bill.total, tuple((line.item_code, line.quantity, line.cost_per_unit) for line in bill.lines.values()))
+
+
+def render_checkout(name, contact, lines, totals):
+    """Builds the payment QR code and a printable receipt entirely in memory
+
+    lines are (item_code, item_name, quantity, unit price, line total in paise), totals is PricingEngine.summary()
+    """
+    import qrcode
+    from PIL import Image, ImageDraw, ImageFont
+
+    # Data to encode in the QR code
+    data = f"Name: {name}\nContact: {contact}\nTotal: ₹ {format_paise(totals['total'])}"
+    qr_image = qrcode.make(data).convert("RGB")
+
+    # Plain receipt; the built-in bitmap font has no rupee sign, so prices use "Rs."
+    font = ImageFont.load_default()
+    columns = [10, 60, 200, 250, 330]  # x position of each cell in an item row
+    rows = [[f"Name: {name}"], [f"Contact: {contact}"], [], ["Code", "Item", "Qty", "Price", "Total"]]
+    for item_code, item_name, quantity, cost_per_unit, line_total in lines:
+        rows.append([item_code, item_name[:20], f"{quantity}", f"{cost_per_unit:.2f}", format_paise(line_total)])
+    rows.append([])
+    if totals["discount"]:
+        rows.append([f"Discount: Rs. {format_paise(totals['discount'])}"])
+    if totals["tax"]:
+        rows.append([f"Tax: Rs. {format_paise(totals['tax'])}"])
+    rows.append([f"Total: Rs. {format_paise(totals['total'])}"])
+
+    line_height = 14
+    receipt = Image.new("RGB", (420, line_height * len(rows) + 20), "white")
+    draw = ImageDraw.Draw(receipt)
+    for i, cells in enumerate(rows):
+        for x, cell in zip(columns, cells):
+            draw.text((x, 10 + i * line_height), cell, fill="black", font=font)
+
+    return CheckoutImages(qr_image, receipt)
+
+
+def import_imaging():
+    # Pulls in qrcode and PIL ahead of the first checkout; they are slow to import on a Pi
+    import qrcode
+    from PIL import Image, ImageDraw, ImageFont, ImageTk
+
+
+class CheckoutRenderer:
+    """Renders checkout images on a worker thread and keeps the last few in an LRU cache"""
+
+    def __init__(self, cache_size=8):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkout")
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # bill_key -> Future
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, name, contact, bill):
+        """Returns a Future for CheckoutImages; repeat calls for an unchanged bill share one render"""
+        key = bill_key(name, contact, bill)
+        with self.lock:
+            future = self.cache.get(key)
+            if future is not None and not (future.done() and future.exception()):
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return future
+
+            self.misses += 1
+            # Snapshot the bill now; the worker must not read it while scans keep changing it
+            lines = [(line.item_code, line.item_name, line.quantity, line.cost_per_unit, bill.pricing.line_net(line.item_code))
+                     for line in bill.lines.values()]
+            future = self.executor.submit(render_checkout, name, contact, lines, bill.pricing.summary())
+            self.cache[key] = future
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return future
+
+    def prewarm(self):
+        """Imports the imaging libraries on the worker thread; returns a Future"""
+        return self.executor.submit(import_imaging)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
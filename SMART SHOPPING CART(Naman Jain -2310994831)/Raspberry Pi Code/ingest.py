@@ -0,0 +1,200 @@
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+# One parsed scan: operation is "+" or "-", count is how many units it stands for,
+# seq is the publisher's sequence number when it sends one (used to drop redeliveries).
+# kind says what item holds: an item name ("name", text scans) or a raw 8-byte
+# item code / RFID UID from a binary frame ("code" / "uid")
+ScanEvent = namedtuple("ScanEvent", ["operation", "item", "count", "seq", "kind"], defaults=(None, "name"))
+
+# Items that are commands rather than products; they are never merged with other scans
+CONTROL_ITEMS = {"inventory"}
+
+
+def parse_scan(mqtt_data):
+    # Text payloads look like "+,Kiwi" or "-,Kiwi", optionally followed by ",<sequence number>"
+    parts = mqtt_data.split(',')
+    if len(parts) not in (2, 3):
+        return None
+    operation = parts[0].strip()
+    item = parts[1].strip()
+    if operation not in ("+", "-") or not item:
+        return None
+
+    seq = None
+    if len(parts) == 3:
+        try:
+            seq = int(parts[2])
+        except ValueError:
+            return None
+    return ScanEvent(operation, item, 1, seq)
+
+
+def coalesce(events):
+    """Collapses repeated +/- scans of the same item into one net change, keeping first-seen order"""
+    result = []
+    net = {}  # (kind, lower-cased item or raw key) -> [event, net quantity]
+
+    def flush_net():
+        for event, quantity in net.values():
+            if quantity > 0:
+                result.append(ScanEvent("+", event.item, quantity, kind=event.kind))
+            elif quantity < 0:
+                result.append(ScanEvent("-", event.item, -quantity, kind=event.kind))
+        net.clear()
+
+    for event in events:
+        if event.kind == "name":
+            key = event.item.lower()
+            if key in CONTROL_ITEMS:
+                # Control scans act as a barrier so ordering around them is preserved
+                flush_net()
+                result.append(event)
+                continue
+        else:
+            key = (event.kind, event.item)
+        entry = net.setdefault(key, [event, 0])
+        entry[1] += event.count if event.operation == "+" else -event.count
+
+    flush_net()
+    return result
+
+
+class ScanQueue:
+    """Bounded hand-off from the MQTT network thread to the Tk main loop"""
+
+    OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+    def __init__(self, maxsize=256, overflow="drop_oldest", put_timeout=0.05):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.put_timeout = put_timeout  # How long "block" may hold up the network thread
+        self.events = deque()
+        self.not_full = threading.Condition(threading.Lock())
+
+        # Counters
+        self.received = 0
+        self.dropped = 0
+        self.overflows = 0
+
+    def put(self, event):
+        # Returns False if the event was dropped
+        with self.not_full:
+            self.received += 1
+            if len(self.events) >= self.maxsize:
+                self.overflows += 1
+                if self.overflow == "drop_oldest":
+                    self.events.popleft()
+                    self.dropped += 1
+                elif self.overflow == "drop_newest":
+                    self.dropped += 1
+                    return False
+                else:
+                    # Back-pressure: make the producer wait a little for the UI to catch up
+                    deadline = time.monotonic() + self.put_timeout
+                    while len(self.events) >= self.maxsize:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.dropped += 1
+                            return False
+                        self.not_full.wait(remaining)
+            self.events.append(event)
+            return True
+
+    def requeue(self, events):
+        # Put drained events back at the front, in order, e.g. after their commit failed; they
+        # were admitted once already, so they are not counted or turned away again
+        with self.not_full:
+            self.events.extendleft(reversed(events))
+
+    def drain(self, max_batch=64):
+        with self.not_full:
+            batch = []
+            while self.events and len(batch) < max_batch:
+                batch.append(self.events.popleft())
+            if batch:
+                self.not_full.notify_all()
+            return batch
+
+    def __len__(self):
+        return len(self.events)
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "dropped": self.dropped,
+            "overflows": self.overflows,
+            "queued": len(self.events)
+        }
+
+
+class ScanFilter:
+    """Drops repeated reads of a tag left on the reader and rate-limits each cart
+
+    A scan repeating the same operation and item on the same cart within `window` seconds
+    of the previous one is suppressed, and every suppressed repeat restarts the window,
+    so a tag resting on the reader counts once however long it stays there. Scans that
+    carry a sequence number are separate reads by definition and skip this check.
+
+    Each cart also gets a token bucket: `rate` scans per second on average, up to `burst`
+    at once. rate=None turns rate limiting off.
+    """
+
+    def __init__(self, window=1.5, rate=10, burst=20, max_keys=4096):
+        self.window = window
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.last_seen = OrderedDict()  # (cart, operation, kind, item) -> monotonic time, oldest first
+        self.buckets = {}  # cart -> [tokens, last refill time]
+        self.lock = threading.Lock()
+
+        # Counters
+        self.passed = 0
+        self.duplicates = 0
+        self.rate_limited = 0
+
+    def suppress(self, cart, event, now=None):
+        """Returns why the scan should be dropped ("duplicate" or "rate_limited"), or None to let it through"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if event.seq is None and self.window:
+                key = (cart, event.operation, event.kind, event.item.lower() if event.kind == "name" else event.item)
+                last = self.last_seen.pop(key, None)
+                self.last_seen[key] = now
+                self.expire(now)
+                if last is not None and now - last < self.window:
+                    self.duplicates += 1
+                    return "duplicate"
+
+            if self.rate:
+                bucket = self.buckets.get(cart)
+                if bucket is None:
+                    bucket = self.buckets[cart] = [self.burst, now]
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                if bucket[0] < 1:
+                    self.rate_limited += 1
+                    return "rate_limited"
+                bucket[0] -= 1
+
+            self.passed += 1
+            return None
+
+    def expire(self, now):
+        # Entries are kept in last-seen order, so stale ones are always at the front
+        while self.last_seen:
+            key, seen = next(iter(self.last_seen.items()))
+            if now - seen < self.window and len(self.last_seen) <= self.max_keys:
+                break
+            del self.last_seen[key]
+
+    def stats(self):
+        return {
+            "passed": self.passed,
+            "duplicates": self.duplicates,
+            "rate_limited": self.rate_limited
+        }
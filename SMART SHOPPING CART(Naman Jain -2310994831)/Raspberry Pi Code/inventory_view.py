@@ -0,0 +1,153 @@
+import threading
+import tkinter as tk
+from tkinter import Toplevel
+
+
+class InventoryViewer:
+    """Inventory window that only creates Labels for the rows on screen, whatever the catalog size"""
+
+    VISIBLE_ROWS = 15
+    SEARCH_DELAY_MS = 150  # Wait for a pause in typing before searching
+    REFRESH_MS = 1000  # Quantities change while the window is open
+
+    # (header, width, sort key)
+    COLUMNS = [
+        ("Item Code", 15, lambda item: item.item_code),
+        ("Item Name", 20, lambda item: item.item_name.lower()),
+        ("Quantity", 15, lambda item: item.quantity),
+        ("Price per Quantity", 20, lambda item: item.price_per_quantity)
+    ]
+
+    def __init__(self, app, catalog):
+        self.app = app
+        self.catalog = catalog
+        self.items = catalog.items
+        self.view = range(len(self.items))  # Positions of the rows to show, in display order
+        self.offset = 0  # First visible position in self.view
+        self.query = ""
+        self.sort_column = None
+        self.sort_reverse = False
+        self.search_job = None
+
+        self.window = Toplevel(app.root)
+        self.window.title("Inventory List")
+        self.window.configure(bg=app.bg_color)
+
+        # Search box
+        tk.Label(self.window, text="Search :", font=app.normal_font, bg=app.bg_color, fg=app.fg_color).grid(row=0, column=0, padx=10, pady=5, sticky='w')
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", self.on_search_changed)
+        tk.Entry(self.window, textvariable=self.search_var, width=30, font=app.normal_font, bg=app.entry_bg, fg=app.fg_color, insertbackground=app.fg_color).grid(row=0, column=1, columnspan=2, padx=10, pady=5, sticky='w')
+        self.count_label = tk.Label(self.window, font=app.normal_font, bg=app.bg_color, fg=app.fg_color)
+        self.count_label.grid(row=0, column=3, padx=10, pady=5, sticky='e')
+
+        # Column headers double as sort buttons
+        for column, (text, width, _) in enumerate(self.COLUMNS):
+            tk.Button(self.window, text=text, font=app.normal_font, width=width, anchor='w', bg=app.table_header_bg, fg=app.fg_color, relief="flat", command=lambda column=column: self.sort_by(column)).grid(row=1, column=column, padx=10, pady=10, sticky='w')
+
+        # Fixed pool of row Labels, re-filled with text as the user scrolls
+        self.rows = []
+        for r in range(self.VISIBLE_ROWS):
+            row_color = app.table_row1_bg if r % 2 == 0 else app.table_row2_bg
+            labels = []
+            for column, (_, width, _) in enumerate(self.COLUMNS):
+                label = tk.Label(self.window, font=app.normal_font, width=width, bg=row_color, fg=app.fg_color, relief="solid", padx=10, pady=5, anchor='w')
+                label.grid(row=r + 2, column=column, padx=1, pady=1, sticky='w')
+                label.bind("<MouseWheel>", self.on_mouse_wheel)
+                label.bind("<Button-4>", lambda event: self.scroll_to(self.offset - 3))
+                label.bind("<Button-5>", lambda event: self.scroll_to(self.offset + 3))
+                labels.append(label)
+            self.rows.append(labels)
+
+        self.scrollbar = tk.Scrollbar(self.window, orient="vertical", command=self.on_scrollbar)
+        self.scrollbar.grid(row=2, column=len(self.COLUMNS), rowspan=self.VISIBLE_ROWS, sticky='ns')
+
+        self.render()
+        self.refresh()
+
+        # Build the search index in the background so the first keystroke is fast
+        threading.Thread(target=catalog.get_search_index, daemon=True).start()
+
+    def render(self):
+        # Fill the row pool from self.view starting at self.offset
+        total = len(self.view)
+        for r, labels in enumerate(self.rows):
+            position = self.offset + r
+            if position < total:
+                item = self.items[self.view[position]]
+                labels[0].config(text=item.item_code)
+                labels[1].config(text=item.item_name)
+                labels[2].config(text=f"{item.quantity}")
+                labels[3].config(text=f"₹ {item.price_per_quantity:.2f}")
+            else:
+                for label in labels:
+                    label.config(text="")
+
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.VISIBLE_ROWS) / total))
+        else:
+            self.scrollbar.set(0, 1)
+        self.count_label.config(text=f"{total} items")
+
+    def refresh(self):
+        if not self.window.winfo_exists():
+            return
+        if self.catalog.items is not self.items:
+            # Catalog was reloaded from disk, positions are no longer valid
+            self.items = self.catalog.items
+            self.apply_search(self.query, incremental=False)
+        else:
+            self.render()
+        self.window.after(self.REFRESH_MS, self.refresh)
+
+    def scroll_to(self, offset):
+        self.offset = max(0, min(offset, len(self.view) - self.VISIBLE_ROWS))
+        self.render()
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * len(self.view)))
+        elif action == "scroll":
+            step = self.VISIBLE_ROWS if unit == "pages" else 1
+            self.scroll_to(self.offset + int(amount) * step)
+
+    def on_mouse_wheel(self, event):
+        self.scroll_to(self.offset - (3 if event.delta > 0 else -3))
+
+    def on_search_changed(self, *args):
+        if self.search_job:
+            self.window.after_cancel(self.search_job)
+        self.search_job = self.window.after(self.SEARCH_DELAY_MS, self.run_search)
+
+    def run_search(self):
+        self.search_job = None
+        query = self.search_var.get().strip().lower()
+        # Typing more characters only narrows the previous result, so re-check just that subset
+        incremental = bool(self.query) and query.startswith(self.query)
+        self.apply_search(query, incremental)
+
+    def apply_search(self, query, incremental):
+        if query:
+            index = self.catalog.get_search_index()
+            view = index.search(query, within=self.view if incremental else None)
+        else:
+            view = range(len(self.items))
+        self.query = query
+        self.view = view
+        if self.sort_column is not None:
+            self.sort_view()
+        self.offset = 0
+        self.render()
+
+    def sort_by(self, column):
+        # Clicking the same header again flips the order
+        self.sort_reverse = not self.sort_reverse if self.sort_column == column else False
+        self.sort_column = column
+        self.sort_view()
+        self.offset = 0
+        self.render()
+
+    def sort_view(self):
+        key = self.COLUMNS[self.sort_column][2]
+        items = self.items
+        self.view = sorted(self.view, key=lambda i: key(items[i]), reverse=self.sort_reverse)
@@ -0,0 +1,297 @@
+import json
+import os
+import threading
+import time
+
+from metrics import METRICS
+from storage import WriteBehind
+
+# One append-only file per cart session, sessions/<session id>.journal, one JSON record per line:
+#
+#   {"op": "customer", "name", "contact", "started"}     details typed on the login screen
+#   {"op": "line", "item_code", "quantity", ...}         a bill line's new quantity (0 = off the bill) with
+#                                                        item_name and cost_per_unit, plus the item's stock
+#                                                        and the storage version right after the change
+#   {"op": "bill"}                                       the whole bill was swapped; its lines follow
+#   {"op": "checkpoint", "v"}                            inventory up to storage version v is on disk
+#   {"op": "close", "status", "at"}                      the session is over and the file can go
+#
+# Records hold absolute values, so replaying one twice changes nothing, and a torn last
+# line (power cut mid-write) is simply dropped.
+
+
+class SessionState:
+    """What replaying a session's journal gives back; grows with the basket, not the catalog"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.customer = None  # {"name", "contact", "started"}
+        self.lines = {}  # item_code -> bill line dict, in bill order
+        self.stock = {}  # item_code -> (stock right after its last change, storage version)
+        self.checkpoint = 0
+        self.closed = None  # Close status once the session is over
+        self.records = 0
+
+    def apply(self, record):
+        op = record.get("op")
+        if op == "line":
+            item_code = record["item_code"]
+            if record["quantity"] > 0:
+                self.lines[item_code] = {"item_code": item_code, "item_name": record["item_name"],
+                                         "cost_per_unit": record["cost_per_unit"], "quantity": record["quantity"]}
+            else:
+                self.lines.pop(item_code, None)
+            if "stock" in record:
+                self.stock[item_code] = (record["stock"], record["v"])
+        elif op == "bill":
+            self.lines = {}
+        elif op == "customer":
+            self.customer = {"name": record["name"], "contact": record["contact"], "started": record["started"]}
+        elif op == "checkpoint":
+            self.checkpoint = max(self.checkpoint, record["v"])
+        elif op == "close":
+            self.closed = record["status"]
+        self.records += 1
+
+    def last_version(self):
+        return max([self.checkpoint] + [version for _, version in self.stock.values()])
+
+    def unsaved_stock(self):
+        # Stock changes made after the last checkpoint; they may never have reached inventory.json
+        return {item_code: stock for item_code, (stock, version) in self.stock.items() if version > self.checkpoint}
+
+    def snapshot(self):
+        """The fewest records that replay to this same state"""
+        records = []
+        if self.customer:
+            records.append(dict(self.customer, op="customer"))
+        records.append({"op": "bill"})
+        for line in self.lines.values():
+            records.append(dict(line, op="line"))
+        for item_code, (stock, version) in self.stock.items():
+            if version > self.checkpoint:
+                line = self.lines.get(item_code) or {"item_code": item_code, "quantity": 0}
+                records.append(dict(line, op="line", stock=stock, v=version))
+        records.append({"op": "checkpoint", "v": self.checkpoint})
+        return records
+
+
+def read_journal(path):
+    session_id = os.path.basename(path)[:-len(".journal")]
+    state = SessionState(session_id)
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break  # Torn tail: everything before it is intact
+            state.apply(record)
+    return state
+
+
+class SessionJournal:
+    """Write-ahead journal of the open cart session, so a crash or power cut loses nothing
+
+    record() only appends to a buffer; a WriteBehind writes the buffer out and fsyncs
+    about every `flush_delay` seconds, so a burst of scans costs one fsync. JsonStorage
+    flushes the journal before writing its own files, so the journal is never behind them.
+    Finished session files are deleted on a background thread, and an open session is
+    rewritten as a snapshot once it passes `compact_after` records.
+    """
+
+    def __init__(self, directory="sessions", flush_delay=0.2, compact_after=1000):
+        self.directory = directory
+        self.compact_after = compact_after
+        self.lock = threading.Lock()  # Guards buffer and state; record() runs on the Tk thread, checkpoint() on the storage writer
+        self.io_lock = threading.Lock()  # Guards the file
+        self.buffer = []
+        self.file = None
+        self.state = None  # SessionState of the open session; None between customers
+        self.base = 0  # Storage versions restart at 0 every run; this keeps journaled versions increasing
+        self.writer = WriteBehind(self.write, flush_delay)
+        self.bill = None
+        self.catalog = None
+        self.storage = None
+        os.makedirs(directory, exist_ok=True)
+
+    def session_path(self, session_id):
+        return os.path.join(self.directory, f"{session_id}.journal")
+
+    def sessions(self):
+        # Oldest first; session ids are start times in milliseconds
+        return [os.path.join(self.directory, name) for name in sorted(os.listdir(self.directory)) if name.endswith(".journal")]
+
+    def recover(self):
+        """Replays the journal files and reopens the newest unfinished session; returns its state or None"""
+        finished = []
+        unfinished = []
+        for path in self.sessions():
+            try:
+                state = read_journal(path)
+            except OSError as e:
+                print(f"Skipping session journal {path}: {e}")
+                continue
+            if state.closed:
+                finished.append(path)
+            else:
+                unfinished.append((path, state))
+
+        # Only one session is open at a time; older unfinished ones were abandoned
+        for path, _ in unfinished[:-1]:
+            print(f"Discarding abandoned session journal {path}")
+            finished.append(path)
+        self.compact_in_background(finished)
+        if not unfinished:
+            return None
+
+        _, state = unfinished[-1]
+        with self.io_lock, self.lock:
+            self.state = state
+            self.base = state.last_version()
+            self.rewrite()  # Drops any torn tail before we append to the file again
+        return state
+
+    def resume(self, bill, catalog, storage):
+        """Puts the bill and stock back the way the unfinished session left them; returns its state or None"""
+        state = self.recover()
+        if state is None:
+            return None
+        if storage.transactional:
+            # Stock and bill lines were committed together, so the database already agrees with itself
+            bill.load()
+        else:
+            bill.replace(list(state.lines.values()))
+            for item_code, stock in state.unsaved_stock().items():
+                item = catalog.get(item_code)
+                if item and item.quantity != stock:
+                    catalog.adjust(item, stock - item.quantity)
+        return state
+
+    def watch(self, bill, catalog, storage):
+        """Journals every change to the bill from now on"""
+        self.bill = bill
+        self.catalog = catalog
+        self.storage = storage
+        bill.subscribe(self.on_bill_changed)
+        if not storage.transactional:
+            storage.before_save.append(self.flush)
+            storage.after_save.append(self.checkpoint)
+
+    def on_bill_changed(self, item_code):
+        if item_code is None:
+            # Whole bill swapped (loaded, replaced or cleared)
+            if self.state is None and not self.bill.lines:
+                return
+            self.record({"op": "bill"})
+            for line in self.bill.lines.values():
+                self.record(dict(line.to_dict(), op="line"))
+            return
+
+        line = self.bill.get(item_code)
+        record = line.to_dict() if line else {"item_code": item_code, "quantity": 0}
+        record["op"] = "line"
+        item = self.catalog.get(item_code)
+        if item is not None and not self.storage.transactional:
+            record["stock"] = item.quantity
+            record["v"] = self.base + self.storage.version
+        self.record(record)
+
+    def set_customer(self, name, contact, started):
+        self.record({"op": "customer", "name": name, "contact": contact, "started": started})
+
+    def record(self, record):
+        with self.lock:
+            if self.state is None:
+                self.begin()
+            self.state.apply(record)
+            self.buffer.append(json.dumps(record))
+        self.writer.schedule()
+
+    def checkpoint(self, version):
+        # Called by JsonStorage once inventory.json holds every stock change up to `version`
+        with self.lock:
+            if self.state is None:
+                return
+            record = {"op": "checkpoint", "v": self.base + version}
+            self.state.apply(record)
+            self.buffer.append(json.dumps(record))
+        self.writer.schedule()
+
+    def begin(self):
+        # Caller holds self.lock
+        session_id = f"{int(time.time() * 1000):013d}"
+        self.state = SessionState(session_id)
+        self.file = open(self.session_path(session_id), "a")
+
+    def close(self, status="paid"):
+        """Ends the open session; its file is deleted in the background"""
+        with self.lock:
+            if self.state is None:
+                return
+            record = {"op": "close", "status": status, "at": time.strftime("%Y-%m-%d %H:%M:%S")}
+            self.state.apply(record)
+            self.buffer.append(json.dumps(record))
+        self.writer.schedule()
+        self.flush()
+        with self.io_lock, self.lock:
+            path = self.session_path(self.state.session_id)
+            self.file.close()
+            self.file = None
+            self.state = None
+        self.compact_in_background([path])
+
+    def flush(self):
+        self.writer.flush()
+
+    def write(self):
+        with self.io_lock:
+            with self.lock:
+                data = "".join(line + "\n" for line in self.buffer)
+                self.buffer = []
+                file = self.file
+            if file is None or not data:
+                return
+            with METRICS.span("persist"):
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            with self.lock:
+                # A snapshot is about one record per line, so only count what came after it
+                if self.state is not None and self.state.records > self.compact_after + len(self.state.lines):
+                    self.rewrite()
+
+    def rewrite(self):
+        # Replace the open session's file with a snapshot of its state; caller holds both locks
+        path = self.session_path(self.state.session_id)
+        tmp_path = path + ".tmp"
+        records = self.state.snapshot()
+        with open(tmp_path, "w") as file:
+            file.write("".join(json.dumps(record) + "\n" for record in records))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+        if self.file is not None:
+            self.file.close()
+        self.file = open(path, "a")
+        self.buffer = []  # Already part of the snapshot
+        self.state.records = len(records)
+
+    def compact_in_background(self, paths):
+        if paths:
+            threading.Thread(target=remove_files, args=(paths,), daemon=True).start()
+
+    def shutdown(self):
+        # The open session stays on disk and is resumed on the next start
+        self.flush()
+        with self.io_lock, self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
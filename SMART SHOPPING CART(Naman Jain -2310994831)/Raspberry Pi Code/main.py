@@ -1,14 +1,79 @@
+import time
+PROCESS_START = time.perf_counter()  # Taken before the other imports so startup timings include them
+
 import tkinter as tk
 from tkinter import messagebox, font, Toplevel
 from datetime import datetime
 import json
-import qrcode
-import paho.mqtt.client as mqtt 
-from PIL import Image, ImageTk  
+import argparse
+import threading
+from collections import deque
+from catalog import Catalog
+from bill import Bill
+from ingest import ScanFilter, ScanQueue, parse_scan, coalesce
+from bill_view import BillTable
+from inventory_view import InventoryViewer
+from mqtt_link import MqttLink
+from protocol import parse_payload, FrameError, SCAN_TOPIC, BILL_TOPIC, RESTOCK_TOPIC
+from restock import RestockVerifier, apply_restock, parse_message, restock_secret
+from cart import Cart, ScanResult
+from storage import open_storage
+from checkout import CheckoutRenderer
+from notifications import Notifier
+from pricing import PricingRules, load_rules
+from sales_log import SalesLog
+from journal import SessionJournal
+from startup import StartupTimer
+from metrics import METRICS, serve_metrics
+
+# MQTT broker details
+MQTT_HOST = "broker.emqx.io"
+MQTT_PORT = 1883
+MQTT_TOPIC = SCAN_TOPIC
+RESTOCK_SECRET = restock_secret()  # MQTT restocks are ignored unless SMART_CART_RESTOCK_SECRET is set
+MQTT_CLIENT_ID = None  # None = "smart-cart-<random id kept in mqtt_client_id>"; must differ per cart
+
+# Scan ingest settings (MQTT thread -> Tk main loop)
+SCAN_QUEUE_SIZE = 256              # Max scans waiting for the UI
+SCAN_OVERFLOW_POLICY = "drop_oldest"  # "drop_oldest", "drop_newest" or "block"
+SCAN_PUMP_INTERVAL_MS = 50         # How often the Tk loop drains the queue
+SCAN_BATCH_SIZE = 64               # Max scans handled per pump
+SCAN_REPEAT_WINDOW = 1.5           # Seconds a repeated read of the same tag is ignored (reader polls every ~0.5 s)
+SCAN_RATE_LIMIT = 10               # Scans per second allowed per cart on average...
+SCAN_RATE_BURST = 20               # ...and at most this many at once
+SCAN_COMMIT_RETRIES = 3            # Passes a batch that failed to save is tried again before it is given up
+
+# Storage backend: "json" (inventory.json + bill.json) or "sqlite"
+STORAGE = "json"
+DB_PATH = "smart_cart.db"
+
+# Tax rates and promotions (3-for-2, category discounts, bundles)
+PROMOTIONS_PATH = "promotions.json"
+
+# Completed sales, one append-only file per day (read by analytics.py)
+SALES_DIR = "sales"
+
+# Write-ahead journal of the open session; an unfinished one is resumed on the next start
+SESSIONS_DIR = "sessions"
+
+# Start rendering the checkout QR once the bill has been quiet for this long
+PRERENDER_DELAY_MS = 1000
+
+# Show the login screen first and load the rest (keyboard, catalog, MQTT, QR libraries) after it
+FAST_START = True
+
+# Local metrics endpoint (/metrics and /metrics.json); None leaves instrumentation switched off
+METRICS_PORT = None
 
 class BillApp:
-    def __init__(self, root):
+    def __init__(self, root, cart_id=None, storage=None, fast_start=FAST_START, startup=None):
         self.root = root
+        self.startup = startup or StartupTimer()
+        self.startup.begin("login screen")
+        self.storage = storage or open_storage(STORAGE, DB_PATH)
+        # With a cart_id this UI is a thin client of cart_server.py instead of applying scans itself
+        self.cart_id = cart_id
+        self.pending_snapshot = None
         self.root.title("Smart Cart")
         self.root.geometry("800x480")
 
@@ -53,10 +118,170 @@ class BillApp:
         self.keyboard_frame = tk.Frame(root, bg=self.bg_color)
         self.keyboard_frame.grid(row=4, column=0, columnspan=2, pady=10)
 
+        # Inventory and bill are loaded once; scans work on these in-memory copies
+        self.catalog = Catalog(self.storage)
+        pricing = PricingRules()  # A thin client shows and charges the totals the cart server priced
+        if cart_id is None:
+            try:
+                pricing = load_rules(PROMOTIONS_PATH)
+            except Exception as e:
+                print("Failed to load promotions, using plain prices:", e)
+        self.bill = Bill(self.storage, pricing)
+        self.cart = Cart(self.catalog, self.bill)
+        self.catalog_ready = False
+        self.catalog_error = None
+        self.catalog_loader = None
+
+        # QR code and receipt are rendered on a worker thread and cached per bill
+        self.checkout = CheckoutRenderer()
+        self.prerender_job = None
+        self.sales_log = SalesLog(SALES_DIR)
+        self.journal = SessionJournal(SESSIONS_DIR) if cart_id is None else None  # The cart server owns thin clients' bills
+
+        # Routine messages are toasts that fade on their own; only fatal errors use modal dialogs
+        self.notifier = Notifier(self.root, self.normal_font)
+
+        # Flush pending writes before the window closes
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # MQTT callbacks only enqueue scans; the Tk loop applies them in batches once the catalog is loaded
+        self.scan_queue = ScanQueue(SCAN_QUEUE_SIZE, SCAN_OVERFLOW_POLICY)
+        self.reported_drops = 0
+        self.failed_commits = 0  # Passes in a row whose batch could not be saved
+        self.scan_filter = ScanFilter(SCAN_REPEAT_WINDOW, SCAN_RATE_LIMIT, SCAN_RATE_BURST)
+        self.pending_restocks = deque()  # Raw restock messages, applied on the Tk thread ahead of scans
+
+        # One MQTT connection for the whole process, connecting in the background
+        self.restock_verifier = RestockVerifier(RESTOCK_SECRET) if RESTOCK_SECRET and cart_id is None else None
+        topics = [MQTT_TOPIC] if cart_id is None else [f"{BILL_TOPIC}/{cart_id}"]
+        if self.restock_verifier:
+            topics.append(RESTOCK_TOPIC)
+        self.mqtt = MqttLink(MQTT_HOST, MQTT_PORT, topics, self.on_message, client_id=MQTT_CLIENT_ID)
+
+        # Connection status line under the keyboard
+        self.mqtt_status_label = tk.Label(root, font=self.normal_font, bg=self.bg_color, fg=self.fg_color)
+        self.mqtt_status_label.grid(row=5, column=0, columnspan=2, pady=5)
+        self.widget_count = 0
+        self.register_gauges()
+        self.startup.end("login screen")
+
+        if fast_start:
+            # Nothing below is needed to type a name, so let the window appear first
+            self.root.after_idle(self.finish_startup)
+        else:
+            self.create_keyboard()
+            self.load_catalog()
+            self.on_catalog_loaded()
+            self.start_mqtt()
+            self.startup.begin("qr libraries")
+            self.checkout.prewarm().result()
+            self.startup.end("qr libraries")
+
+    def finish_startup(self):
+        # First idle pass after mainloop started: the login screen is on screen now
+        self.startup.mark("first frame")
         self.create_keyboard()
 
+        self.catalog_loader = threading.Thread(target=self.load_catalog, daemon=True)
+        self.catalog_loader.start()
+        self.wait_for_catalog()
+
+        self.start_mqtt()
+
+        self.startup.begin("qr libraries")
+        self.checkout.prewarm().add_done_callback(lambda future: self.startup.end("qr libraries"))
+
+    def load_catalog(self):
+        # Reads the inventory and builds the search index; runs on a worker thread in fast start
+        self.startup.begin("catalog load")
+        try:
+            self.catalog.load()
+            self.catalog.get_search_index()
+        except Exception as e:
+            self.catalog_error = e
+        self.startup.end("catalog load")
+
+    def wait_for_catalog(self):
+        if self.catalog_loader.is_alive():
+            self.root.after(20, self.wait_for_catalog)
+            return
+        self.on_catalog_loaded()
+
+    def on_catalog_loaded(self):
+        # Back on the Tk thread: restore the bill and start applying scans
+        session = None
+        try:
+            if self.catalog_error:
+                raise self.catalog_error
+            session = self.resume_session()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load inventory or bill data: {e}")
+        self.catalog_ready = True
+        if session is not None and session.customer:
+            customer = session.customer
+            self.open_details_window(customer["name"], customer["contact"], started=customer["started"])
+            self.notifier.notify(f"Resumed the bill for {customer['name']}")
+
+        # Watch the inventory for changes made outside the app
+        self.watch_catalog()
+        self.pump_scans()
+
+    def resume_session(self):
+        # Pick up an unfinished session left by a crash or power cut; otherwise start with an empty bill
+        self.startup.begin("session resume")
+        session = self.journal.resume(self.bill, self.catalog, self.storage) if self.journal else None
+        if session is None:
+            self.bill.clear()
+        if self.journal:
+            self.journal.watch(self.bill, self.catalog, self.storage)
+        self.startup.end("session resume")
+        return session
+
+    def start_mqtt(self):
+        self.startup.begin("mqtt connect")
+        self.setup_mqtt()
+        self.show_mqtt_status()
+
+    def register_gauges(self):
+        # Read by the metrics endpoint thread, so only plain attributes here, never Tk calls
+        METRICS.gauge("mqtt_connects", lambda: self.mqtt.connects)
+        METRICS.gauge("mqtt_reconnects", lambda: self.mqtt.reconnects)
+        METRICS.gauge("mqtt_duplicates", lambda: self.mqtt.duplicates)
+        METRICS.gauge("scan_queue_depth", lambda: len(self.scan_queue))
+        METRICS.gauge("scan_queue_dropped", lambda: self.scan_queue.dropped)
+        METRICS.gauge("scans_suppressed_duplicate", lambda: self.scan_filter.duplicates)
+        METRICS.gauge("scans_suppressed_rate_limited", lambda: self.scan_filter.rate_limited)
+        METRICS.gauge("bill_lines", lambda: len(self.bill.lines))
+        METRICS.gauge("widgets", lambda: self.widget_count)
+
+    def count_widgets(self):
+        # Walks the whole widget tree, so only done while metrics are on
+        count = 0
+        pending = [self.root]
+        while pending:
+            widget = pending.pop()
+            count += 1
+            pending.extend(widget.winfo_children())
+        self.widget_count = count
+
+    def watch_catalog(self):
+        try:
+            self.catalog.reload_if_changed()
+        except Exception as e:
+            print("Failed to reload inventory:", e)
+        self.root.after(2000, self.watch_catalog)
+
+    def on_close(self):
+        self.mqtt.stop()
+        self.checkout.shutdown()
+        self.storage.close()
+        if self.journal:
+            self.journal.shutdown()  # An open session stays on disk and is resumed next time
+        self.root.destroy()
+
     def create_keyboard(self):
         """Creates an on-screen keyboard"""
+        self.startup.begin("keyboard")
         keys = [
             '1', '2', '3', '4', '5', '6', '7', '8', '9', '0',
             'Q', 'W', 'E', 'R', 'T', 'Y', 'U', 'I', 'O', 'P',
@@ -73,6 +298,7 @@ class BillApp:
             if col == 10:
                 col = 0
                 row += 1
+        self.startup.end("keyboard")
 
     def on_key_press(self, key):
 
@@ -106,171 +332,190 @@ class BillApp:
 
 
     def setup_mqtt(self):
-        # MQTT connection parameters
-        self.mqtt_client = mqtt.Client()
-        self.mqtt_client.on_connect = self.on_connect
-        self.mqtt_client.on_message = self.on_message
+        # Non-blocking: the link connects, subscribes (QoS 1) and reconnects with backoff on its own thread
+        try:
+            self.mqtt.start()
+        except Exception as e:
+            print("Failed to start MQTT client:", e)
 
-        # Connect to the MQTT broker
-        self.mqtt_client.connect("broker.emqx.io", 1883, 60)
-        self.mqtt_client.loop_start()  # Start MQTT loop in a separate thread
+    def show_mqtt_status(self):
+        status = self.mqtt.status()
+        if status["state"] == "connected" and self.startup.is_pending("mqtt connect"):
+            self.startup.end("mqtt connect")
+        if METRICS.enabled:
+            self.count_widgets()
+        self.mqtt_status_label.config(text=f"MQTT: {status['state']} (reconnects: {status['reconnects']})")
+        self.root.after(1000, self.show_mqtt_status)
 
     def process_mqtt_data(self, mqtt_data):
-        operation = mqtt_data.split(',')[0]
-        item = mqtt_data.split(',')[1]
-
-        if operation == "-" and item != "Inventory":
-            self.remove_item(item)
-        elif operation == "+" and item != "Inventory":
-            self.add_item(item)
-        elif operation == "+" and item == "Inventory":
-            self.update_inventory()  # Call the update_inventory function
-            messagebox.showinfo("Inventory Updated", "Inventory updated all item's quantity is increased by 10")
-
-    def remove_item(self, item):
-        # Load the bill data
+        # Parse a text scan and apply it right away (must run on the Tk thread)
+        with METRICS.span("parse"):
+            event = parse_scan(mqtt_data)
+        if event:
+            self.apply_scan(event)
+
+    def apply_scan(self, event):
+        result = self.cart.apply(event)
+        if result:
+            self.report_scan(result)
+
+    def report_scan(self, result):
+        # Tell the user what happened to a scan
+        if result.status == "added":
+            print(f"Item '{result.item}' added or updated successfully in bill data and inventory updated.")
+        elif result.status == "removed":
+            print(f"Item '{result.item}' removed or updated successfully in bill data and inventory updated.")
+        elif result.status == "not_found":
+            self.notifier.notify(f"'{result.item}' is not available in inventory", "warning")
+        elif result.status == "not_in_bill":
+            self.notifier.notify(f"'{result.item}' is not in the bill", "warning")
+        elif result.status == "out_of_stock":
+            self.notifier.notify(f"'{result.item}' is out of stock", "warning")
+        elif result.status == "restocked":
+            print(f"Inventory updated: all item quantities increased by {result.quantity}")
+            self.notifier.notify(f"Inventory updated: every item +{result.quantity}")
+
+    def pump_scans(self):
+        # Runs on the Tk loop for the life of the app; nothing that goes wrong in one pass may stop it
         try:
-            with open("bill.json", "r") as file:
-                bill_data = json.load(file)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load bill data: {e}")
+            self.drain_scans()
+        finally:
+            # Come straight back if there is still a backlog, otherwise poll at the normal rate
+            self.root.after(1 if len(self.scan_queue) else SCAN_PUMP_INTERVAL_MS, self.pump_scans)
+
+    def drain_scans(self):
+        # Drain queued scans on the Tk thread, merging repeats of the same item into one change
+        self.apply_bill_snapshot()
+        while self.pending_restocks:
+            self.apply_restock_message(self.pending_restocks.popleft())
+        batch = self.scan_queue.drain(SCAN_BATCH_SIZE)
+        results = []
+        if batch:
+            with METRICS.span("batch"):
+                try:
+                    # The whole batch is committed together; each scan is still its own nested transaction
+                    with self.catalog.transaction():
+                        for event in coalesce(batch):
+                            try:
+                                result = self.cart.apply(event)
+                            except Exception as e:
+                                print("Failed to apply scan:", event, e)
+                                continue
+                            if result:
+                                results.append(result)
+                except Exception as e:
+                    # Commit failed: memory is ahead of storage, so re-read both and try the scans again
+                    print("Failed to save scans:", e)
+                    results = []
+                    self.reload_after_failed_commit()
+                    self.retry_scans(batch)
+                else:
+                    self.failed_commits = 0
+            METRICS.log("scan_batch", events=len(batch), results=len(results), queued=len(self.scan_queue))
+
+        # Notices only after the commit, so they always describe what was actually saved
+        for result in results:
+            self.report_scan(result)
+
+        if self.scan_queue.dropped != self.reported_drops:
+            self.reported_drops = self.scan_queue.dropped
+            print("Scan queue overflow:", self.scan_queue.stats())
+            self.notifier.notify("Scanning too fast, some scans were missed", "warning")
+
+    def retry_scans(self, batch):
+        # The next pass tries the batch again; a batch that keeps failing is given up, loudly
+        self.failed_commits += 1
+        if self.failed_commits <= SCAN_COMMIT_RETRIES:
+            self.scan_queue.requeue(batch)
             return
+        self.failed_commits = 0
+        self.notifier.notify(f"{len(batch)} scans could not be saved, please scan them again", "error")
 
-        # Load the inventory data
+    def reload_after_failed_commit(self):
+        # A failed reload (e.g. a half-edited inventory.json) must not stop the scan pump
         try:
-            with open("inventory.json", "r") as inv_file:
-                inventory_data = json.load(inv_file)
+            self.catalog.load()
+            self.bill.load()
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to load inventory data: {e}")
-            return
+            print("Failed to reload inventory or bill:", e)
+            self.notifier.notify("Could not save or reload the bill; scans may be missing", "error")
 
-        # Find the item in the bill
-        bill_item = next((bill_item for bill_item in bill_data if bill_item["item_name"].lower() == item.lower()), None)
-        if not bill_item:
-            messagebox.showwarning("Item Not Found", f"The item '{item}' is not in the bill.")
+    def apply_restock_message(self, payload):
+        # Back-office stock and price changes; the sender gets the applied/rejected report back
+        try:
+            report = apply_restock(self.catalog, parse_message(payload))
+        except Exception as e:
+            print("Failed to apply restock:", e)
+            self.notifier.notify("Restock failed, nothing was changed", "error")
             return
+        print("Restock:", report)
+        self.notifier.notify(f"Restock: {report}", "warning" if report.rejected else "info")
+        self.mqtt.publish(f"{RESTOCK_TOPIC}/result", json.dumps(report.to_dict()))
 
-        # Decrement the quantity of the item in the bill
-        bill_item["quantity"] = max(0, bill_item["quantity"] - 1)
-        if bill_item["quantity"] == 0:
-            bill_data.remove(bill_item)  # Remove the item if quantity reaches zero
+    def remove_item(self, item, quantity=1, inventory_item=None):
+        self.report_scan(self.cart.remove(item, quantity, inventory_item))
 
-        # Find the item in the inventory and increase the quantity by 1
-        inventory_item = next((inv_item for inv_item in inventory_data if inv_item["item_name"].lower() == item.lower()), None)
-        if inventory_item:
-            inventory_item["quantity"] += 1
+    def add_item(self, item_name, quantity=1, item_details=None):
+        self.report_scan(self.cart.add(item_name, quantity, item_details))
 
-        # Save the updated bill data back to the JSON file
-        with open("bill.json", "w") as file:
-            json.dump(bill_data, file, indent=4)
-
-        # Save the updated inventory data back to the JSON file
-        with open("inventory.json", "w") as inv_file:
-            json.dump(inventory_data, inv_file, indent=4)
-
-        print(f"Item '{item}' removed or updated successfully in bill data and inventory updated.")
-
-
-    import json
-
-    def add_item(self, item_name):
-        # Load inventory data to fetch item details
+    def update_inventory(self):
         try:
-            with open("inventory.json", "r") as inv_file:
-                inventory_data = json.load(inv_file)
+            self.report_scan(self.cart.restock_all())
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to load inventory data: {e}")
+            self.notifier.notify(f"Failed to update inventory: {e}", "error")
+
+    def on_message(self, client, userdata, msg):
+        # Runs on paho's network thread: only parse and enqueue, never touch Tk or files here
+        if self.cart_id is not None:
+            self.on_bill_snapshot(msg)
             return
-        
-        # Find item in inventory
-        item_details = next((item for item in inventory_data if item["item_name"].lower() == item_name.lower()), None)
-        if not item_details:
-            messagebox.showwarning("Item Not Found", f"The item '{item_name}' is not available in inventory.")
+        if msg.topic == RESTOCK_TOPIC:
+            if self.restock_verifier is None:
+                return
+            try:
+                self.pending_restocks.append(self.restock_verifier.verify(msg.payload))
+            except ValueError as e:
+                print("Ignoring restock:", e)
             return
 
-        # Check if there is enough quantity in inventory
-        if item_details["quantity"] <= 0:
-            messagebox.showwarning("Out of Stock", f"The item '{item_name}' is out of stock.")
-            return
-        
-        # Load the current bill data
         try:
-            with open("bill.json", "r") as bill_file:
-                bill_data = json.load(bill_file)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load bill data: {e}")
+            with METRICS.span("parse"):
+                frame_cart_id, events = parse_payload(msg.payload)
+        except FrameError as e:
+            print("Ignoring bad scan:", e)
+            METRICS.inc("bad_frames")
             return
-
-        # Check if the item is already in the bill
-        bill_item = next((item for item in bill_data if item["item_name"].lower() == item_name.lower()), None)
-        
-        if bill_item:
-            # If item is already in bill, increase the quantity by 1
-            bill_item["quantity"] += 1
-        else:
-            # If item is not in the bill, add it with quantity 1
-            new_item = {
-                "item_code": item_details["item_code"],
-                "item_name": item_details["item_name"],
-                "cost_per_unit": item_details["price_per_quantity"],
-                "quantity": 1
-            }
-            bill_data.append(new_item)
-        
-        # Decrease inventory quantity by 1
-        item_details["quantity"] -= 1
-
-        # Save the updated bill data back to the JSON file
-        with open("bill.json", "w") as bill_file:
-            json.dump(bill_data, bill_file, indent=4)
-
-        # Save the updated inventory data back to the JSON file
-        with open("inventory.json", "w") as inv_file:
-            json.dump(inventory_data, inv_file, indent=4)
-
-        print(f"Item '{item_name}' added or updated successfully in bill data and inventory updated.")
-
-        # Update the details window with the latest bill data if it's open
-        if hasattr(self, "details_window") and self.details_window.winfo_exists():
-            self.display_bill_data(self.details_window, self.name_entry.get(), self.contact_entry.get())
-
-
-    def update_inventory(self):
+        METRICS.inc("scan_events", len(events))
+
+        for event in events:
+            # Drop redeliveries of scans that carry a sequence number (the link counts them)
+            if event.seq is not None and self.mqtt.seen_seq(frame_cart_id or msg.topic, event.seq):
+                continue
+            # Tag resting on the reader, or a reader flooding us: drop it before it costs any work
+            if self.scan_filter.suppress(frame_cart_id or msg.topic, event):
+                continue
+            self.scan_queue.put(event)
+
+    def on_bill_snapshot(self, msg):
+        # Thin client: the cart server owns the bill, we only mirror its latest snapshot
         try:
-            # Load inventory data from inventory.json
-            with open("inventory.json", "r") as file:
-                inventory_data = json.load(file)
-
-            # Increment each item's quantity by 10
-            for item in inventory_data:
-                item["quantity"] += 10
-
-            # Save the updated inventory back to inventory.json
-            with open("inventory.json", "w") as file:
-                json.dump(inventory_data, file, indent=4)
-            
-            print("Inventory updated: all item quantities increased by 10")
-
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to update inventory: {e}")
-            
-    def on_connect(self, client, userdata, flags, rc):
-        if rc == 0:
-            print("Connected to MQTT broker")
-            # Subscribe to the topic
-            client.subscribe("RF_SMART_CART_DTS")
-        else:
-            print("Failed to connect, return code:", rc)
+            snapshot = json.loads(msg.payload)
+        except ValueError:
+            print("Failed to decode bill snapshot")
+            return
+        if msg.retain:
+            # A retained snapshot is old news: show the bill but don't repeat its notifications
+            snapshot.pop("results", None)
+        self.pending_snapshot = snapshot
+
+    def apply_bill_snapshot(self):
+        snapshot, self.pending_snapshot = self.pending_snapshot, None
+        if snapshot is None:
+            return
+        self.bill.replace(snapshot.get("lines", []), snapshot.get("pricing"))
+        for status, item, quantity in snapshot.get("results", []):
+            self.report_scan(ScanResult(status, item, quantity))
 
-    def on_message(self, client, userdata, msg):
-        try:
-            # Decode and parse the JSON message
-            raw_payload = msg.payload.decode().strip()
-            print("Received MQTT message:", raw_payload)
-            self.process_mqtt_data(raw_payload)
-        except json.JSONDecodeError:
-            print("Failed to decode message")
-    
     def validate_contact(self, new_value):
         # Allow only digits and restrict any non-numeric input
         return new_value.isdigit() or new_value == ""
@@ -282,28 +527,28 @@ class BillApp:
 
         # Validate data
         if name == "" or contact == "":
-            messagebox.showwarning("Input Error", "Please fill in all fields.")
+            self.notifier.notify("Please fill in all fields", "warning")
             return
         
         if len(contact) < 10:
-            messagebox.showwarning("Contact Error", "Please enter a 10-digit contact number.")
+            self.notifier.notify("Please enter a 10-digit contact number", "warning")
             return
 
         # Open a new window with the details
         self.open_details_window(name, contact)
         self.clear_entries()
 
-    def open_details_window(self, name, contact):
-        # Initialize MQTT client and connect to the broker
-        self.setup_mqtt()
-
-        # Get current date and time
-        current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def open_details_window(self, name, contact, started=None):
+        # Get current date and time; a resumed session keeps the time it started
+        current_datetime = started or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if self.journal and started is None:
+            self.journal.set_customer(name, contact, current_datetime)
 
         # Create new Toplevel window
         details_window = Toplevel(self.root)
         details_window.title("Billing System")
         details_window.configure(bg=self.bg_color)
+        self.notifier.attach(details_window)  # Scan notices show on the bill while it is open
 
         # Display the details with appropriate colors
         tk.Label(details_window, text=f"Name: {name}", font=self.normal_font, anchor="w", bg=self.bg_color, fg=self.fg_color).grid(row=0, column=0, pady=2, padx=20, sticky="w")
@@ -314,64 +559,26 @@ class BillApp:
         # Pass name and contact to display_bill_data
         self.display_bill_data(details_window, name, contact, current_datetime)
 
-        # Set up periodic update of bill data every 1000 milliseconds
-        self.update_bill_data(details_window,current_datetime, name, contact)
-
     def display_bill_data(self, details_window, name, contact, current_datetime):
-        # Clear existing widgets to prevent duplicate entries and buttons
-        for widget in details_window.grid_slaves():
-            widget.grid_forget()  # Remove all widgets in details_window
-
-        # Reload bill data from the JSON file
-        try:
-            with open("bill.json", "r") as file:
-                bill_data = json.load(file)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load bill data: {e}")
-            return
-
-        # Display the details with appropriate colors
-        tk.Label(details_window, text=f"Name: {name}", font=self.normal_font, anchor="w", bg=self.bg_color, fg=self.fg_color).grid(row=0, column=0, pady=5, padx=20, sticky="w")
-        tk.Label(details_window, text=f"Contact: {contact}", font=self.normal_font, anchor="w", bg=self.bg_color, fg=self.fg_color).grid(row=0, column=4, pady=5, padx=20, sticky="w")
-        tk.Label(details_window, text=f"Date and Time: {current_datetime}", font=self.normal_font, anchor="w", bg=self.bg_color, fg=self.fg_color).grid(row=1, column=0, columnspan=3, pady=5, padx=20, sticky="w")
-        tk.Button(details_window, text="View Inventory", padx=10, pady=5, font=self.normal_font, bg=self.button_bg, fg=self.fg_color, command=self.view_inventory).grid(row=1, column=4, padx=20, pady=5, sticky="w")
-
-        # Add table headers
-        tk.Label(details_window, text="Item Code", font=self.normal_font, width=15, anchor='w', bg=self.table_header_bg, fg=self.fg_color).grid(row=2, column=0, padx=10, pady=10, sticky='w')
-        tk.Label(details_window, text="Item Name", font=self.normal_font, width=20, anchor='w', bg=self.table_header_bg, fg=self.fg_color).grid(row=2, column=1, padx=10, pady=10, sticky='w')
-        tk.Label(details_window, text="Quantity", font=self.normal_font, width=20, anchor='w', bg=self.table_header_bg, fg=self.fg_color).grid(row=2, column=2, padx=10, pady=10, sticky='w')
-        tk.Label(details_window, text="Price per Unit", font=self.normal_font, width=20, anchor='w', bg=self.table_header_bg, fg=self.fg_color).grid(row=2, column=3, padx=10, pady=10, sticky='w')
-        tk.Label(details_window, text="Total Price", font=self.normal_font, width=20, anchor='w', bg=self.table_header_bg, fg=self.fg_color).grid(row=2, column=4, padx=10, pady=10, sticky='w')
-
-        # Initialize total sum
-        total_sum = 0
-        row = 4  # Start from the fourth row
-
-        # Display non-zero quantity items in the bill
-        for item in bill_data:
-            if item['quantity'] > 0:  # Only display items with quantity > 0
-                total_price = item["quantity"] * item["cost_per_unit"]
-                total_sum += total_price
-
-                row_color = self.table_row1_bg if (row - 4) % 2 == 0 else self.table_row2_bg
-                tk.Label(details_window, text=item["item_code"], font=self.normal_font, width=15, bg=row_color, fg=self.fg_color, relief="solid", padx=10, pady=5, anchor='w').grid(row=row, column=0, padx=1, pady=1, sticky='w')
-                tk.Label(details_window, text=item["item_name"], font=self.normal_font, width=20, bg=row_color, fg=self.fg_color, relief="solid", padx=10, pady=5, anchor='w').grid(row=row, column=1, padx=1, pady=1, sticky='w')
-                tk.Label(details_window, text=f"{item['quantity']}", font=self.normal_font, width=15, bg=row_color, fg=self.fg_color, relief="solid", padx=10, pady=5, anchor='w').grid(row=row, column=2, padx=1, pady=1, sticky='w')
-                tk.Label(details_window, text=f"₹ {item['cost_per_unit']:.2f}", font=self.normal_font, width=20, bg=row_color, fg=self.fg_color, relief="solid", padx=10, pady=5, anchor='w').grid(row=row, column=3, padx=1, pady=1, sticky='w')
-                tk.Label(details_window, text=f"₹ {total_price:.2f}", font=self.normal_font, width=20, bg=row_color, fg=self.fg_color, relief="solid", padx=10, pady=5, anchor='w').grid(row=row, column=4, padx=1, pady=1, sticky='w')
-                row += 1
-
-        # Display total sum and add the "Checkout" button once at the end
-        tk.Label(details_window, text="Total Sum:", font=self.normal_font, width=20, anchor='e', bg=self.bg_color, fg=self.fg_color).grid(row=row, column=3, padx=10, pady=5, sticky="e")
-        tk.Label(details_window, text=f"₹ {total_sum:.2f}", font=self.normal_font, width=20, anchor='w', bg=self.bg_color, fg=self.fg_color).grid(row=row, column=4, padx=10, pady=5, sticky="w")
-
-        # Place "Checkout" button below the total sum
-        tk.Button(details_window, text="Checkout", bg=self.button_bg, fg=self.fg_color, font=self.normal_font, command=lambda: self.show_qr_code(name, contact, total_sum)).grid(row=row + 1, column=0, columnspan=5, pady=5)
-
-    def update_bill_data(self, details_window, current_datetime, name, contact):
-        # This function is called every 1000ms to update bill data in the details window
-        self.display_bill_data(details_window, name, contact, current_datetime)
-        details_window.after(2000, self.update_bill_data, details_window, current_datetime, name, contact)
+        # Build the bill table once; after that it redraws itself only for the rows the bill reports as changed
+        with METRICS.span("render"):
+            details_window.bill_table = BillTable(self, details_window, self.bill, lambda: self.show_qr_code(name, contact))
+
+        # Render the checkout speculatively whenever the bill settles, so Checkout opens instantly
+        prerender = lambda item_code: self.schedule_prerender(name, contact)
+        self.bill.subscribe(prerender)
+        details_window.bind("<Destroy>", lambda event: self.bill.unsubscribe(prerender) if event.widget is details_window else None, add="+")
+        self.schedule_prerender(name, contact)
+
+    def schedule_prerender(self, name, contact):
+        if self.prerender_job:
+            self.root.after_cancel(self.prerender_job)
+        self.prerender_job = self.root.after(PRERENDER_DELAY_MS, self.prerender_checkout, name, contact)
+
+    def prerender_checkout(self, name, contact):
+        self.prerender_job = None
+        if self.bill.lines:
+            self.checkout.render(name, contact, self.bill)
 
     def clear_entries(self):
         # Clear entries after submission
@@ -379,73 +586,111 @@ class BillApp:
         self.contact_entry.delete(0, tk.END)
 
     def load_inventory(self):
-        # Load inventory from the JSON file
-        try:
-            with open("inventory.json", "r") as file:
-                inventory = json.load(file)
-            return inventory
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load inventory: {e}")
-            return []
+        # The catalog is already resident, just hand back its records
+        return self.catalog.items
 
     def view_inventory(self):
-        # Create new Toplevel window for inventory
-        inventory_window = Toplevel(self.root)
-        inventory_window.title("Inventory List")
-        inventory_window.configure(bg=self.bg_color)
+        if not self.catalog_ready:
+            self.notifier.notify("The inventory is still loading")
+            return
 
         # Load inventory data
         inventory = self.load_inventory()
 
         if not inventory:
-            messagebox.showwarning("No Inventory", "No inventory data available.")
+            self.notifier.notify("No inventory data available", "warning")
             return
 
-        # Create table headers with appropriate colors
-        tk.Label(inventory_window, text="Item Code", font=self.normal_font, width=15, anchor='w', bg=self.table_header_bg, fg=self.fg_color).grid(row=0, column=0, padx=10, pady=10, sticky='w')
-        tk.Label(inventory_window, text="Item Name", font=self.normal_font, width=20, anchor='w', bg=self.table_header_bg, fg=self.fg_color).grid(row=0, column=1, padx=10, pady=10, sticky='w')
-        tk.Label(inventory_window, text="Quantity", font=self.normal_font, width=20, anchor='w', bg=self.table_header_bg, fg=self.fg_color).grid(row=0, column=2, padx=10, pady=10, sticky='w')
-        tk.Label(inventory_window, text="Price per Quantity", font=self.normal_font, width=20, anchor='w', bg=self.table_header_bg, fg=self.fg_color).grid(row=0, column=3, padx=10, pady=10, sticky='w')
-
+        # Virtualized table: only the visible rows exist as widgets
+        InventoryViewer(self, self.catalog)
 
-        # Display inventory items in table format
-        for i, item in enumerate(inventory, 1):
-            # Row color alternation for better visibility
-            row_color = self.table_row1_bg if i % 2 == 0 else self.table_row2_bg
-            
-            # Create labels with padding and styling
-            tk.Label(inventory_window, text=item["item_code"], font=self.normal_font, width=15, bg=row_color, fg=self.fg_color, relief="solid", padx=10, pady=5, anchor='w').grid(row=i, column=0, padx=1, pady=1, sticky='w')
-            tk.Label(inventory_window, text=item["item_name"], font=self.normal_font, width=20, bg=row_color, fg=self.fg_color, relief="solid", padx=10, pady=5, anchor='w').grid(row=i, column=1, padx=1, pady=1, sticky='w')
-            tk.Label(inventory_window, text=f"{item['quantity']}", font=self.normal_font, width=15, bg=row_color, fg=self.fg_color, relief="solid", padx=10, pady=5, anchor='w').grid(row=i, column=2, padx=1, pady=1, sticky='w')
-            tk.Label(inventory_window, text=f"₹ {item['price_per_quantity']:.2f}", font=self.normal_font, width=20, bg=row_color, fg=self.fg_color, relief="solid", padx=10, pady=5, anchor='w').grid(row=i, column=3, padx=1, pady=1, sticky='w')
-    
-    def show_qr_code(self, name, contact, total_sum):
+    def show_qr_code(self, name, contact):
         # Create a new Toplevel window for QR code
         qr_window = Toplevel(self.root)
         qr_window.title("QR Code")
         qr_window.configure(bg=self.bg_color)
 
-        # Data to encode in the QR code
-        data = f"Name: {name}\nContact: {contact}\nTotal: ₹ {total_sum:.2f}"
+        status_label = tk.Label(qr_window, text="Preparing your bill...", font=self.normal_font, bg=self.bg_color, fg=self.fg_color)
+        status_label.pack(padx=40, pady=40)
 
-        # Generate QR code and save it temporarily
-        qr = qrcode.make(data)
-        qr.save("temp_qr.png")  # Save the QR code as an image file
+        # Served from the cache if the bill hasn't changed since it was pre-rendered
+        future = self.checkout.render(name, contact, self.bill)
+        self.show_checkout_images(qr_window, status_label, future)
 
-        # Open the saved image with PIL and convert to ImageTk.PhotoImage for Tkinter compatibility
-        qr_image = Image.open("temp_qr.png")
-        qr_photo = ImageTk.PhotoImage(qr_image)
+    def show_checkout_images(self, qr_window, status_label, future):
+        if not qr_window.winfo_exists():
+            return
+        if not future.done():
+            qr_window.after(20, self.show_checkout_images, qr_window, status_label, future)
+            return
 
-        # Display the QR code in the new window
+        try:
+            images = future.result()
+        except Exception as e:
+            status_label.config(text=f"Failed to create QR code: {e}")
+            return
+        status_label.destroy()
+
+        # PhotoImage must be created on the Tk thread, so only this last step happens here
+        from PIL import ImageTk
+        qr_photo = ImageTk.PhotoImage(images.qr)
+        receipt_photo = ImageTk.PhotoImage(images.receipt)
+
+        # Display the QR code and receipt in the new window
         tk.Label(qr_window, image=qr_photo, bg=self.bg_color).pack(pady=20)
+        tk.Label(qr_window, image=receipt_photo, bg=self.bg_color).pack(padx=20, pady=(0, 20))
 
         # Keep a reference to prevent garbage collection
         qr_window.qr_photo = qr_photo  # Prevents the image from being garbage collected
+        qr_window.receipt_photo = receipt_photo
+
+        tk.Button(qr_window, text="Payment Received", padx=10, pady=5, font=self.button_font, bg=self.button_bg, fg=self.fg_color,
+                  command=lambda: self.payment_received(qr_window)).pack(pady=(0, 20))
+
+    def payment_received(self, qr_window):
+        # Close the sale: it goes into the sales log and the cart starts over with an empty bill
+        if not self.bill.lines:
+            self.notifier.notify("There is nothing to pay for", "warning")
+            return
+
+        if self.cart_id is not None:
+            # The cart server owns this bill; it records the sale when the cart is reset
+            self.mqtt.publish(f"{SCAN_TOPIC}/{self.cart_id}/reset", b"")
+        else:
+            try:
+                self.sales_log.record_sale(self.bill)
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to record the sale: {e}")
+                return
+            self.journal.close("paid")
+            self.bill.clear()
+
+        qr_window.destroy()
+        self.notifier.notify("Payment received. Thank you for shopping with Smart Cart!")
 
 # Create the main application window and run the app
 if __name__ == "__main__":
-    with open('bill.json', 'w') as file:
-        json.dump([], file)
+    parser = argparse.ArgumentParser(description="Smart Cart billing screen")
+    parser.add_argument("--cart-id", help="run as a thin client of cart_server.py for this cart")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default=STORAGE)
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database used with --storage sqlite")
+    parser.add_argument("--eager-start", action="store_true", help="load everything before showing the window (old behaviour)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="serve /metrics and /metrics.json on localhost")
+    parser.add_argument("--json-logs", action="store_true", help="print one JSON line per scan and batch")
+    args = parser.parse_args()
+
+    if args.metrics_port is not None or args.json_logs:
+        METRICS.enable(json_logs=args.json_logs)
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_port)
+
+    startup = StartupTimer(PROCESS_START)
+    startup.mark("imports")
+
+    # The bill is cleared (or an unfinished session resumed) once the catalog is loaded
+    storage = open_storage(args.storage, args.db)
+    if args.cart_id is None and not storage.claim():
+        parser.error("the inventory is in use by another cart app or cart server")
     root = tk.Tk()
-    app = BillApp(root)
+    app = BillApp(root, args.cart_id, storage, fast_start=not args.eager_start, startup=startup)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,234 @@
+import json
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+PREFIX = "smart_cart_"
+
+# Upper bounds in seconds; scan stages range from microseconds (parse) to tens of ms (a JSON rewrite)
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class NullSpan:
+    """What span() hands out while metrics are off: entering and leaving it does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Histogram:
+    """Fixed-bucket histogram, the same shape Prometheus expects"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, fraction):
+        # Upper bound of the bucket holding the requested quantile
+        with self.lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return 0.0
+        rank = fraction * count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """Counters, histograms and gauges for the scan path
+
+    Disabled by default, in which case span(), inc() and log() return straight away, so
+    the instrumentation can stay in the hot path. Labels are passed as keyword arguments.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.json_logs = False
+        self.log_file = sys.stdout
+        self.started = time.time()
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.gauges = {}  # name -> value, or a function returning it, read at scrape time
+        self.lock = threading.Lock()
+
+    def enable(self, json_logs=False, log_file=None):
+        self.enabled = True
+        self.json_logs = json_logs
+        if log_file is not None:
+            self.log_file = log_file
+
+    def span(self, stage):
+        """Times a block of code into smart_cart_stage_seconds{stage=...}"""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self.histogram("stage_seconds", stage=stage))
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name, value):
+        # value may be a function, e.g. lambda: mqtt.status()["reconnects"]
+        self.gauges[name] = value
+
+    def log(self, event, **fields):
+        """Writes one JSON object per line, when JSON logs are switched on"""
+        if not self.json_logs:
+            return
+        record = {"ts": round(time.time(), 3), "event": event}
+        record.update(fields)
+        print(json.dumps(record, default=str), file=self.log_file, flush=True)
+
+    def gauge_values(self):
+        values = {}
+        for name, value in list(self.gauges.items()):
+            try:
+                values[name] = value() if callable(value) else value
+            except Exception:
+                continue
+        return values
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda entry: entry[0])
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name}_total counter")
+            lines.append(f"{PREFIX}{name}_total{format_labels(labels)} {value}")
+
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+            with histogram.lock:
+                counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{PREFIX}{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{PREFIX}{name}_count{format_labels(labels)} {count}")
+
+        for name, value in sorted(self.gauge_values().items()):
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            lines.append(f"{PREFIX}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda entry: entry[0])
+        uptime = time.time() - self.started
+        return {
+            "uptime_s": round(uptime, 1),
+            "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in counters],
+            "histograms": [{
+                "name": name,
+                "labels": dict(labels),
+                "count": histogram.count,
+                "sum": histogram.sum,
+                "p50": histogram.quantile(0.50),
+                "p99": histogram.quantile(0.99)
+            } for (name, labels), histogram in histograms],
+            "gauges": self.gauge_values()
+        }
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+# One registry per process, shared by every module on the scan path
+METRICS = Metrics()
+
+
+def render(path):
+    # Returns (body, content type) for a metrics endpoint, or None if there is none at `path`
+    if path == "/metrics":
+        return METRICS.to_prometheus().encode(), "text/plain; version=0.0.4"
+    if path == "/metrics.json":
+        return json.dumps(METRICS.to_json()).encode(), "application/json"
+    return None
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """Serves /metrics (Prometheus text) and /metrics.json on a daemon thread"""
+    # Imported here: http.server pulls in email, html and more, which every start would pay for otherwise
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            page = render(self.path)
+            if page is None:
+                self.send_error(404)
+                return
+            body, content_type = page
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes every few seconds would drown out everything else on the console
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    print(f"Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,207 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from metrics import METRICS
+
+# Where this install keeps its MQTT client id (see install_id)
+CLIENT_ID_PATH = "mqtt_client_id"
+
+
+def install_id(path=CLIENT_ID_PATH):
+    """Random id made on first run and kept in `path`
+
+    Client ids must be unique on the broker, and with a persistent session two clients
+    sharing one keep kicking each other off. Hostnames don't do: every stock Pi is
+    "raspberrypi".
+    """
+    try:
+        with open(path, "r") as file:
+            value = file.read().strip()
+        if value:
+            return value
+    except FileNotFoundError:
+        pass
+    value = uuid.uuid4().hex[:12]
+    try:
+        with open(path, "w") as file:
+            file.write(value + "\n")
+    except OSError as e:
+        print(f"Could not save the MQTT client id to {path}: {e}")
+    return value
+
+
+class DedupWindow:
+    """Recently seen message keys, used to apply redelivered scans only once
+
+    A key is forgotten `ttl` seconds after it was last seen (or when `size` newer keys
+    push it out), so a publisher that starts its numbering again is only ignored briefly.
+    """
+
+    def __init__(self, size=1024, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.keys = OrderedDict()  # key -> monotonic time last seen, oldest first
+        self.lock = threading.Lock()
+        self.duplicates = 0
+
+    def seen(self, key, now=None):
+        # Returns True if key was already in the window, otherwise records it
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.expire(now)
+            hit = key in self.keys
+            self.remember(key, now)
+            if hit:
+                self.duplicates += 1
+            return hit
+
+    def record(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.expire(now)
+            self.remember(key, now)
+
+    def remember(self, key, now):
+        # Caller holds self.lock
+        self.keys[key] = now
+        self.keys.move_to_end(key)
+        if len(self.keys) > self.size:
+            self.keys.popitem(last=False)
+
+    def expire(self, now):
+        # Caller holds self.lock
+        if self.ttl is None:
+            return
+        while self.keys:
+            key, last = next(iter(self.keys.items()))
+            if now - last < self.ttl:
+                break
+            del self.keys[key]
+
+
+def default_client_factory(client_id):
+    import paho.mqtt.client as mqtt
+    # clean_session=False lets the broker keep our QoS 1 subscription and queue scans while we reconnect
+    return mqtt.Client(client_id=client_id, clean_session=False)
+
+
+class MqttLink:
+    """One long-lived MQTT connection per process with non-blocking connect and automatic reconnect"""
+
+    def __init__(self, host, port, topics, on_message, keepalive=60, qos=1,
+                 min_backoff=1, max_backoff=60, dedup_size=1024, dedup_ttl=300, seq_ttl=30,
+                 client_id=None, client_factory=None):
+        self.host = host
+        self.port = port
+        self.topics = list(topics)
+        self.on_message = on_message  # Called as on_message(client, userdata, msg) for each new message
+        self.keepalive = keepalive
+        self.qos = qos
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.client_id = client_id or f"smart-cart-{install_id()}"
+        self.client_factory = client_factory or default_client_factory
+        # Broker redeliveries (same packet id) can come after a long reconnect; a publisher's own
+        # resend of a sequence number comes within seconds, and it may restart its numbering later
+        self.dedup = DedupWindow(dedup_size, dedup_ttl)
+        self.seq_dedup = DedupWindow(dedup_size, seq_ttl)
+        self.client = None
+
+        # Connection state, readable from any thread
+        self.state = "stopped"  # stopped, connecting, connected, reconnecting
+        self.connects = 0
+        self.reconnects = 0
+        self.last_error = None
+
+    def start(self):
+        # Safe to call more than once; only the first call creates a client
+        if self.client is not None:
+            return
+        self.client = self.client_factory(self.client_id)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+
+        # paho doubles the retry delay from min_backoff up to max_backoff between attempts
+        self.client.reconnect_delay_set(min_delay=self.min_backoff, max_delay=self.max_backoff)
+        self.state = "connecting"
+        self.client.connect_async(self.host, self.port, self.keepalive)
+        self.client.loop_start()  # Network loop runs (and retries the first connect) on its own thread
+
+    def stop(self):
+        if self.client is None:
+            return
+        self.client.disconnect()
+        self.client.loop_stop()
+        self.client = None
+        self.state = "stopped"
+
+    def add_topic(self, topic):
+        # Subscribe now if connected; either way it is re-subscribed after every reconnect
+        if topic in self.topics:
+            return
+        self.topics.append(topic)
+        if self.client is not None and self.state == "connected":
+            self.client.subscribe(topic, qos=self.qos)
+
+    def publish(self, topic, payload, qos=None, retain=False):
+        if self.client is None:
+            return False
+        info = self.client.publish(topic, payload, qos=self.qos if qos is None else qos, retain=retain)
+        return info.rc == 0
+
+    def seen_seq(self, publisher, seq):
+        # True if this publisher's scan `seq` was already delivered
+        return self.seq_dedup.seen((publisher, seq))
+
+    @property
+    def duplicates(self):
+        return self.dedup.duplicates + self.seq_dedup.duplicates
+
+    def status(self):
+        return {
+            "state": self.state,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "duplicates": self.duplicates,
+            "last_error": self.last_error
+        }
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            if self.connects:
+                self.reconnects += 1
+            self.connects += 1
+            self.state = "connected"
+            print("Connected to MQTT broker")
+            METRICS.log("mqtt_connected", host=self.host, connects=self.connects)
+            # Subscribe to the topics
+            for topic in self.topics:
+                client.subscribe(topic, qos=self.qos)
+        else:
+            self.last_error = f"connect failed, return code {rc}"
+            self.state = "reconnecting"
+            print("Failed to connect, return code:", rc)
+
+    def _on_disconnect(self, client, userdata, rc):
+        if self.client is None:
+            return
+        if rc != 0:
+            self.last_error = f"unexpected disconnect, return code {rc}"
+        self.state = "reconnecting"
+        print("Disconnected from MQTT broker, return code:", rc)
+        METRICS.log("mqtt_disconnected", host=self.host, rc=rc)
+
+    def _on_message(self, client, userdata, msg):
+        # A QoS 1 redelivery carries the dup flag and the packet id of the original
+        if msg.qos > 0:
+            key = ("mid", msg.topic, msg.mid)
+            if not msg.dup:
+                self.dedup.record(key)
+            elif self.dedup.seen(key):
+                return
+        METRICS.inc("mqtt_messages")
+        with METRICS.span("receive"):
+            self.on_message(client, userdata, msg)
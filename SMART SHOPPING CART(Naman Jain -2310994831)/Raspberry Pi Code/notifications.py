@@ -0,0 +1,99 @@
+import time
+import tkinter as tk
+from collections import OrderedDict
+
+# Background colour per level; text is always white
+LEVEL_COLORS = {"info": "#555555", "warning": "#b36b00", "error": "#a12a2a"}
+
+
+class Notice:
+    __slots__ = ("level", "text", "count", "expires")
+
+    def __init__(self, level, text, expires):
+        self.level = level
+        self.text = text
+        self.count = 1
+        self.expires = expires
+
+
+class Notifier:
+    """Toasts along the bottom of the window, in place of modal dialogs for routine scan events
+
+    notify() returns immediately. A message that is already showing is not repeated; its
+    counter goes up ("Out of stock ×3") and its timer restarts. Notices disappear on their
+    own after `ttl` seconds. Toasts show in the most recently attached window that is still
+    open (the bill window while it is up, otherwise the main window). Tk thread only.
+    """
+
+    def __init__(self, root, font, max_visible=3, ttl=4.0, tick_ms=250):
+        self.root = root
+        self.font = font
+        self.max_visible = max_visible
+        self.ttl = ttl
+        self.tick_ms = tick_ms
+        self.notices = OrderedDict()  # (level, text) -> Notice, most recent last
+        self.hosts = [root]  # Windows toasts can show in; the last live one wins
+        self.frame = None
+        self.labels = []
+        self.tick_job = None
+
+    def attach(self, window):
+        # Show toasts in this window while it exists
+        self.hosts = [host for host in self.hosts if host is self.root or host.winfo_exists()]
+        self.hosts.append(window)
+        self.render()
+
+    def host(self):
+        while len(self.hosts) > 1 and not self.hosts[-1].winfo_exists():
+            self.hosts.pop()
+        return self.hosts[-1]
+
+    def notify(self, text, level="info", ttl=None):
+        key = (level, text)
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        notice = self.notices.pop(key, None)
+        if notice is None:
+            notice = Notice(level, text, expires)
+        else:
+            notice.count += 1
+            notice.expires = max(notice.expires, expires)
+        self.notices[key] = notice
+        self.render()
+        if self.tick_job is None:
+            self.tick_job = self.root.after(self.tick_ms, self.tick)
+
+    def tick(self):
+        self.tick_job = None
+        now = time.monotonic()
+        expired = [key for key, notice in self.notices.items() if notice.expires <= now]
+        for key in expired:
+            del self.notices[key]
+        if expired:
+            self.render()
+        if self.notices:
+            self.tick_job = self.root.after(self.tick_ms, self.tick)
+
+    def render(self):
+        host = self.host()
+        if self.frame is None or self.frame.master is not host or not self.frame.winfo_exists():
+            # First toast, or the host window changed: rebuild the (tiny) toast stack there
+            if self.frame is not None and self.frame.winfo_exists():
+                self.frame.destroy()
+            self.frame = tk.Frame(host, bg=host.cget("bg"))
+            self.labels = [tk.Label(self.frame, font=self.font, fg="white", padx=12, pady=4) for _ in range(self.max_visible)]
+
+        visible = list(self.notices.values())[-self.max_visible:]
+        if not visible:
+            self.frame.place_forget()
+            return
+
+        for i, label in enumerate(self.labels):
+            if i < len(visible):
+                notice = visible[i]
+                text = notice.text if notice.count == 1 else f"{notice.text} ×{notice.count}"
+                label.config(text=text, bg=LEVEL_COLORS.get(notice.level, LEVEL_COLORS["info"]))
+                label.pack(fill="x", pady=1)
+            else:
+                label.pack_forget()
+        self.frame.place(relx=0.5, rely=1.0, anchor="s", y=-8)
+        self.frame.lift()
@@ -0,0 +1,239 @@
+import json
+import os
+from collections import namedtuple
+
+# All amounts in this module are integer paise; rupee floats only exist at the edges (catalog, storage)
+
+# Several items sold together for a fixed price, e.g. 2 Maggi + 1 Kurkure for Rs. 55
+Bundle = namedtuple("Bundle", ["needs", "price", "rates"])  # needs: ((item_code, units), ...), rates: tax bp per need
+
+
+def to_paise(rupees):
+    return int(round(rupees * 100))
+
+
+def format_paise(paise):
+    sign = "-" if paise < 0 else ""
+    return f"{sign}{abs(paise) // 100}.{abs(paise) % 100:02d}"
+
+
+def percent_to_bp(percent):
+    # Basis points keep rates like 2.5% exact
+    return int(round(float(percent) * 100))
+
+
+def scale(amount, bp):
+    # amount * bp / 10000, rounded half up, in integers only
+    return (amount * bp + 5000) // 10000
+
+
+class PricingRules:
+    """Tax rates and promotions, precompiled into per-SKU lookup tables
+
+    Built from promotions.json:
+
+        {
+            "tax_percent": 0,                      default rate for every item
+            "prices_include_tax": true,            shelf prices already contain the tax (MRP)
+            "tax": {"008": 18},                    per-item rates
+            "categories": {"fruit": ["001", "002"]},
+            "promotions": [
+                {"type": "multibuy", "items": ["009"], "buy": 3, "pay": 2},
+                {"type": "percent_off", "category": "fruit", "percent": 10},
+                {"type": "bundle", "items": {"006": 2, "004": 1}, "price": 55.0}
+            ]
+        }
+
+    multibuy and percent_off rules are per line; when several apply to one item the
+    customer gets the best of them. Items that take part in a bundle are left out of
+    line rules so a unit is never discounted twice.
+    """
+
+    def __init__(self, tax_percent=0, prices_include_tax=True, tax=None, categories=None, promotions=()):
+        self.default_tax_bp = percent_to_bp(tax_percent)
+        self.prices_include_tax = prices_include_tax
+        self.tax_bp = {code: percent_to_bp(percent) for code, percent in (tax or {}).items()}
+        self.line_rules = {}  # item_code -> [("multibuy", buy, pay) or ("percent", bp)]
+        self.bundles = []
+        self.bundles_by_sku = {}  # item_code -> indexes into self.bundles
+
+        categories = categories or {}
+        line_promotions = []
+        for promotion in promotions:
+            kind = promotion.get("type")
+            if kind == "bundle":
+                needs = tuple((code, int(units)) for code, units in promotion["items"].items())
+                if not needs or any(units <= 0 for _, units in needs):
+                    raise ValueError(f"Bundle needs at least one item with a positive count: {promotion}")
+                index = len(self.bundles)
+                self.bundles.append(Bundle(needs, to_paise(promotion["price"]), tuple(self.rate(code) for code, _ in needs)))
+                for code, _ in needs:
+                    self.bundles_by_sku.setdefault(code, []).append(index)
+            elif kind in ("multibuy", "percent_off"):
+                line_promotions.append(promotion)
+            else:
+                raise ValueError(f"Unknown promotion type: {kind}")
+
+        for promotion in line_promotions:
+            codes = list(promotion.get("items", []))
+            if "category" in promotion:
+                codes += categories.get(promotion["category"], [])
+            if promotion["type"] == "multibuy":
+                buy, pay = int(promotion["buy"]), int(promotion["pay"])
+                if not 0 <= pay < buy:
+                    raise ValueError(f"multibuy needs 0 <= pay < buy: {promotion}")
+                rule = ("multibuy", buy, pay)
+            else:
+                rule = ("percent", percent_to_bp(promotion["percent"]))
+            for code in codes:
+                if code in self.bundles_by_sku:
+                    print(f"Promotion {promotion} skipped for item {code}: it is part of a bundle")
+                    continue
+                self.line_rules.setdefault(code, []).append(rule)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("tax_percent", 0), data.get("prices_include_tax", True), data.get("tax"),
+                   data.get("categories"), data.get("promotions", []))
+
+    def rate(self, item_code):
+        return self.tax_bp.get(item_code, self.default_tax_bp)
+
+
+def load_rules(path="promotions.json"):
+    # No file means plain prices: no tax shown and no promotions
+    if not os.path.exists(path):
+        return PricingRules()
+    with open(path, "r") as file:
+        return PricingRules.from_dict(json.load(file))
+
+
+class LinePrice:
+    __slots__ = ("quantity", "unit", "gross", "discount", "tax")
+
+    def __init__(self, quantity, unit, gross, discount, tax):
+        self.quantity = quantity
+        self.unit = unit
+        self.gross = gross
+        self.discount = discount
+        self.tax = tax
+
+
+class PricingEngine:
+    """Running subtotal, discount and tax for one bill, updated per changed item
+
+    update() only re-prices the changed line and the bundles that item belongs to, then
+    adjusts the totals by the difference, so the cost of a scan does not grow with the
+    size of the basket.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = rules or PricingRules()
+        self.reset()
+
+    def reset(self):
+        self.lines = {}  # item_code -> LinePrice
+        self.bundle_discounts = [0] * len(self.rules.bundles)
+        self.bundle_taxes = [0] * len(self.rules.bundles)
+        self.subtotal = 0
+        self.discount = 0
+        self.tax = 0
+        self.adopted = None  # Totals priced by someone else (see adopt), shown instead of our own
+
+    @property
+    def total(self):
+        if self.adopted is not None:
+            return self.adopted["total"]
+        if self.rules.prices_include_tax:
+            return self.subtotal - self.discount
+        return self.subtotal - self.discount + self.tax
+
+    def tax_on(self, amount, bp):
+        if self.rules.prices_include_tax:
+            # The tax already inside a tax-inclusive amount
+            return (amount * bp + (10000 + bp) // 2) // (10000 + bp)
+        return scale(amount, bp)
+
+    def update(self, item_code, quantity, unit):
+        """Sets an item's quantity and unit price (paise); quantity 0 takes it off the bill"""
+        old = self.lines.pop(item_code, None)
+        if old is not None:
+            self.subtotal -= old.gross
+            self.discount -= old.discount
+            self.tax -= old.tax
+
+        if quantity > 0:
+            line = self.price_line(item_code, quantity, unit)
+            self.lines[item_code] = line
+            self.subtotal += line.gross
+            self.discount += line.discount
+            self.tax += line.tax
+
+        for index in self.rules.bundles_by_sku.get(item_code, ()):
+            self.update_bundle(index)
+
+    def price_line(self, item_code, quantity, unit):
+        gross = quantity * unit
+        discount = 0
+        for rule in self.rules.line_rules.get(item_code, ()):
+            if rule[0] == "multibuy":
+                _, buy, pay = rule
+                discount = max(discount, (quantity // buy) * (buy - pay) * unit)
+            else:
+                discount = max(discount, scale(gross, rule[1]))
+        return LinePrice(quantity, unit, gross, discount, self.tax_on(gross - discount, self.rules.rate(item_code)))
+
+    def update_bundle(self, index):
+        bundle = self.rules.bundles[index]
+        count = None
+        regular = 0
+        for code, units in bundle.needs:
+            line = self.lines.get(code)
+            sets = line.quantity // units if line else 0
+            count = sets if count is None else min(count, sets)
+            regular += units * line.unit if line else 0
+        discount = count * max(0, regular - bundle.price) if count else 0
+        tax = 0
+        if discount:
+            # The saving is split over the items by regular price, each share at that item's own tax rate
+            left = discount
+            for i, ((code, units), bp) in enumerate(zip(bundle.needs, bundle.rates)):
+                share = left if i == len(bundle.needs) - 1 else discount * units * self.lines[code].unit // regular
+                left -= share
+                tax -= self.tax_on(share, bp)
+
+        self.discount += discount - self.bundle_discounts[index]
+        self.tax += tax - self.bundle_taxes[index]
+        self.bundle_discounts[index] = discount
+        self.bundle_taxes[index] = tax
+
+    @property
+    def prices_include_tax(self):
+        if self.adopted is not None:
+            return self.adopted["prices_include_tax"]
+        return self.rules.prices_include_tax
+
+    def line_net(self, item_code):
+        # What the line costs after its own promotion (bundle savings are shown on the bill total)
+        if self.adopted is not None:
+            return self.adopted["line_net"].get(item_code, 0)
+        line = self.lines.get(item_code)
+        return line.gross - line.discount if line else 0
+
+    def summary(self):
+        return {"subtotal": self.subtotal, "discount": self.discount, "tax": self.tax, "total": self.total}
+
+    def export(self):
+        # Everything a thin client needs to show and charge exactly these totals
+        return dict(self.summary(), prices_include_tax=self.prices_include_tax,
+                    line_net={item_code: self.line_net(item_code) for item_code in self.lines})
+
+    def adopt(self, priced):
+        """Takes over totals from another engine's export(), e.g. the cart server's, instead of pricing here
+
+        Lasts until the next reset(), so the bill shows and charges exactly what the server worked out.
+        """
+        self.adopted = priced
+        self.subtotal = priced["subtotal"]
+        self.discount = priced["discount"]
+        self.tax = priced["tax"]
@@ -0,0 +1,117 @@
+import struct
+
+from ingest import ScanEvent, parse_scan
+
+# MQTT topics. A single cart publishes scans straight to SCAN_TOPIC; carts served by
+# cart_server.py publish to SCAN_TOPIC/<cart_id> and read their bill from BILL_TOPIC/<cart_id>
+# (the sketch's cart_id setting picks which). A server started with --default-cart also
+# takes scans on the bare SCAN_TOPIC, as that cart.
+SCAN_TOPIC = "RF_SMART_CART_DTS"
+BILL_TOPIC = "RF_SMART_CART_BILL"
+# Back-office stock and price changes (see restock.py); results go to RESTOCK_TOPIC/result
+RESTOCK_TOPIC = "RF_SMART_CART_RESTOCK"
+
+# Binary scan frame, version 1 (all integers little-endian):
+#
+#   header  : magic "SC" (2 bytes) | version u8 | cart id u16 | record count u8
+#   record  : sequence u32 | op u8 | key 8 bytes
+#
+# The low bits of op say what happened, the KEY_IS_UID bit says whether key holds an
+# item code (ASCII, NUL padded) or a raw RFID UID (NUL padded). A frame may carry up
+# to 255 records, so a basket dumped onto the reader can go out as a single publish.
+MAGIC = b"SC"
+VERSION = 1
+
+HEADER = struct.Struct("<2sBHB")
+RECORD = struct.Struct("<IB8s")
+KEY_SIZE = 8
+
+OP_ADD = 1
+OP_REMOVE = 2
+OP_RESTOCK = 3  # Same as scanning the "Inventory" card
+KEY_IS_UID = 0x80
+
+OPERATIONS = {OP_ADD: "+", OP_REMOVE: "-"}
+
+
+class FrameError(ValueError):
+    pass
+
+
+def is_binary_frame(payload):
+    return payload[:2] == MAGIC
+
+
+def decode_frame(payload):
+    """Decodes a binary frame into (cart_id, [ScanEvent, ...]); event items are raw 8-byte keys"""
+    view = memoryview(payload)
+    if len(view) < HEADER.size:
+        raise FrameError("Frame too short")
+
+    magic, version, cart_id, count = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise FrameError("Not a scan frame")
+    if version != VERSION:
+        raise FrameError(f"Unsupported frame version {version}")
+    if len(view) != HEADER.size + count * RECORD.size:
+        raise FrameError("Frame length does not match record count")
+
+    events = []
+    for seq, op, key in RECORD.iter_unpack(view[HEADER.size:]):
+        kind = "uid" if op & KEY_IS_UID else "code"
+        op &= ~KEY_IS_UID
+        if op == OP_RESTOCK:
+            events.append(ScanEvent("+", "Inventory", 1, seq))
+        elif op in OPERATIONS:
+            events.append(ScanEvent(OPERATIONS[op], key, 1, seq, kind))
+        else:
+            raise FrameError(f"Unknown op {op}")
+    return cart_id, events
+
+
+def parse_payload(payload):
+    """Decodes either wire format into (frame cart id or None, [ScanEvent, ...])
+
+    Raises FrameError for anything that is not a valid scan.
+    """
+    if is_binary_frame(payload):
+        return decode_frame(payload)
+
+    try:
+        text = payload.decode().strip()
+    except UnicodeDecodeError:
+        raise FrameError("Payload is neither a scan frame nor UTF-8 text")
+    event = parse_scan(text)
+    if event is None:
+        raise FrameError(f"Malformed scan: {text}")
+    return None, [event]
+
+
+def pack_key(key):
+    # Item codes are text, RFID UIDs are bytes; both are NUL padded to KEY_SIZE
+    if isinstance(key, str):
+        key = key.encode("ascii")
+    if len(key) > KEY_SIZE:
+        raise FrameError(f"Key longer than {KEY_SIZE} bytes: {key!r}")
+    return key.ljust(KEY_SIZE, b"\0")
+
+
+def encode_frame(cart_id, records):
+    """Builds a frame from (seq, op, key) tuples; set KEY_IS_UID in op when key is a UID"""
+    if len(records) > 255:
+        raise FrameError("At most 255 records per frame")
+    frame = bytearray(HEADER.size + len(records) * RECORD.size)
+    HEADER.pack_into(frame, 0, MAGIC, VERSION, cart_id, len(records))
+    offset = HEADER.size
+    for seq, op, key in records:
+        RECORD.pack_into(frame, offset, seq, op, b"" if op == OP_RESTOCK else pack_key(key))
+        offset += RECORD.size
+    return bytes(frame)
+
+
+def describe_key(key, kind):
+    # Human readable form of a raw key, for messages about unknown items
+    key = key.rstrip(b"\0")
+    if kind == "uid":
+        return key.hex().upper()
+    return key.decode("ascii", "replace")
@@ -0,0 +1,263 @@
+"""Bulk restock: per-SKU stock deltas and price changes from delivery manifests
+
+A manifest is CSV with a header row, or JSON lines, one change per line:
+
+    item_code,delta,price              {"item_code": "003", "delta": 24, "price": 0.55}
+    003,24,0.55                        {"item_code": "004", "delta": -2}
+    004,-2,
+
+delta (or quantity) is added to the stock and may be negative; price (or
+price_per_quantity) replaces the unit price and may be left empty. Lines are streamed
+and applied as one storage transaction: every valid line lands, or on any failure none
+do. Lines naming an unknown item, taking stock below zero or carrying bad numbers are
+rejected and reported, the rest of the manifest still applies.
+
+    python restock.py delivery.csv [--storage sqlite] [--dry-run]
+    python restock.py delivery.csv --publish broker.emqx.io   # push to running carts over MQTT
+
+The broker is public, so restocks over MQTT are off unless the carts and the sender
+share a secret in SMART_CART_RESTOCK_SECRET. Each message is then signed with an
+HMAC over a timestamp and its lines; unsigned, altered, stale or replayed messages
+are ignored.
+"""
+import argparse
+import csv
+import hashlib
+import hmac
+import io
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+from catalog import Catalog
+from protocol import RESTOCK_TOPIC
+from storage import open_storage
+
+# One change from a manifest; delta and price are None when the line doesn't change them
+RestockLine = namedtuple("RestockLine", ["line_no", "item_code", "delta", "price"])
+
+MAX_REPORTED_REJECTS = 100  # Keep the report small even if a whole manifest is bad
+PUBLISH_CHUNK = 500  # Manifest lines per MQTT message with --publish
+SECRET_ENV = "SMART_CART_RESTOCK_SECRET"  # Shared secret for MQTT restocks; unset turns them off
+MAX_MESSAGE_AGE = 300  # Seconds a signed restock message stays valid
+
+
+class RestockReport:
+    """Outcome of one manifest: how many lines applied and why the others were rejected"""
+
+    def __init__(self):
+        self.applied = 0
+        self.rejected = 0
+        self.rejects = []  # (line_no, reason), the first MAX_REPORTED_REJECTS only
+
+    def reject(self, line_no, reason):
+        self.rejected += 1
+        if len(self.rejects) < MAX_REPORTED_REJECTS:
+            self.rejects.append((line_no, reason))
+
+    def to_dict(self):
+        return {"applied": self.applied, "rejected": self.rejected, "rejects": self.rejects}
+
+    def __str__(self):
+        return f"{self.applied} lines applied, {self.rejected} rejected"
+
+
+class DryRun(Exception):
+    pass
+
+
+def parse_entry(line_no, entry):
+    # Accepts the column names used by inventory.json as well as the short ones
+    entry = {str(key).strip().lower(): value for key, value in entry.items() if key is not None}
+    item_code = str(entry.get("item_code") or "").strip()
+    if not item_code:
+        raise ValueError("missing item_code")
+
+    delta = entry.get("delta", entry.get("quantity"))
+    price = entry.get("price", entry.get("price_per_quantity"))
+    delta = None if delta in (None, "") else int(delta)
+    price = None if price in (None, "") else float(price)
+    if delta is None and price is None:
+        raise ValueError("nothing to change")
+    if price is not None and price < 0:
+        raise ValueError("negative price")
+    return RestockLine(line_no, item_code, delta, price)
+
+
+def read_lines(file, kind):
+    """Yields RestockLines, or (line_no, error) for lines that can't be parsed, without reading the whole file"""
+    if kind == "csv":
+        for line_no, row in enumerate(csv.DictReader(file), start=2):
+            try:
+                yield parse_entry(line_no, row)
+            except (ValueError, TypeError) as e:
+                yield line_no, str(e)
+        return
+
+    for line_no, text in enumerate(file, start=1):
+        text = text.strip()
+        if not text:
+            continue
+        try:
+            entry = json.loads(text)
+            if not isinstance(entry, dict):
+                raise ValueError("expected a JSON object")
+            yield parse_entry(line_no, entry)
+        except (ValueError, TypeError) as e:
+            yield line_no, str(e)
+
+
+def manifest_kind(path):
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def read_manifest(path):
+    with open(path, "r", newline="") as file:
+        yield from read_lines(file, manifest_kind(path))
+
+
+def parse_message(payload):
+    # An MQTT restock message carries manifest lines as JSON lines, or CSV if it starts with a header
+    text = payload.decode("utf-8") if isinstance(payload, bytes) else payload
+    kind = "jsonl" if text.lstrip().startswith("{") else "csv"
+    return read_lines(io.StringIO(text), kind)
+
+
+def apply_restock(catalog, lines, dry_run=False):
+    """Applies a stream of RestockLines to the catalog as one atomic batch; returns a RestockReport"""
+    report = RestockReport()
+    undo = []  # (item, quantity, price) before the first change, to restore memory if the batch fails
+
+    try:
+        with catalog.lock, catalog.transaction():
+            try:
+                for line in lines:
+                    if not isinstance(line, RestockLine):
+                        report.reject(*line)
+                        continue
+                    item = catalog.get(line.item_code)
+                    if item is None:
+                        report.reject(line.line_no, f"unknown item_code {line.item_code}")
+                        continue
+
+                    undo.append((item, item.quantity, item.price_per_quantity))
+                    if line.delta is not None and not catalog.adjust(item, line.delta):
+                        report.reject(line.line_no, f"stock of {line.item_code} would go below zero")
+                        continue
+                    if line.price is not None:
+                        catalog.set_price(item, line.price)
+                    report.applied += 1
+
+                if dry_run:
+                    raise DryRun()
+            except BaseException:
+                # Put the resident copies back before the transaction ends, so JSON storage never
+                # writes the half-applied batch; SQLite rolls its rows back on the way out
+                for item, quantity, price in reversed(undo):
+                    item.quantity = quantity
+                    item.price_per_quantity = price
+                raise
+    except DryRun:
+        pass
+    return report
+
+
+def restock_secret():
+    return os.environ.get(SECRET_ENV) or None
+
+
+def sign_message(body, secret, now=None):
+    # Prefixes the lines with "#sig <unix time> <HMAC-SHA256 of time and lines>"
+    timestamp = str(int(time.time() if now is None else now)).encode()
+    digest = hmac.new(secret.encode(), timestamp + b"\n" + body, hashlib.sha256).hexdigest().encode()
+    return b"#sig " + timestamp + b" " + digest + b"\n" + body
+
+
+class RestockVerifier:
+    """Checks the signature on restock messages from the broker, where anyone can publish"""
+
+    def __init__(self, secret, max_age=MAX_MESSAGE_AGE):
+        self.secret = secret.encode()
+        self.max_age = max_age
+        self.seen = {}  # signature -> timestamp, so a captured message can't be sent again while fresh
+        self.lock = threading.Lock()
+
+    def verify(self, payload, now=None):
+        """Returns the manifest lines of a signed message; raises ValueError for anything else"""
+        now = time.time() if now is None else now
+        header, _, body = payload.partition(b"\n")
+        parts = header.split()
+        if len(parts) != 3 or parts[0] != b"#sig" or not parts[1].isdigit():
+            raise ValueError("unsigned restock message")
+        expected = hmac.new(self.secret, parts[1] + b"\n" + body, hashlib.sha256).hexdigest().encode()
+        if not hmac.compare_digest(expected, parts[2]):
+            raise ValueError("bad restock signature")
+        timestamp = int(parts[1])
+        if abs(now - timestamp) > self.max_age:
+            raise ValueError("stale restock message")
+        with self.lock:
+            self.seen = {signature: sent for signature, sent in self.seen.items() if now - sent <= self.max_age}
+            if parts[2] in self.seen:
+                raise ValueError("replayed restock message")
+            self.seen[parts[2]] = timestamp
+        return body
+
+
+def publish_manifest(path, host, port, secret):
+    # Streams the manifest to running carts in signed chunks; each chunk is applied as its own batch
+    from mqtt_link import default_client_factory, install_id
+
+    client = default_client_factory(f"smart-cart-restock-{install_id()}")
+    client.connect(host, port)
+    client.loop_start()
+    sent = 0
+    try:
+        chunk = []
+        for line in read_manifest(path):
+            if isinstance(line, RestockLine):
+                chunk.append(json.dumps({"item_code": line.item_code, "delta": line.delta, "price": line.price}))
+            else:
+                print(f"Line {line[0]}: {line[1]}")
+            if len(chunk) == PUBLISH_CHUNK:
+                client.publish(RESTOCK_TOPIC, sign_message("\n".join(chunk).encode(), secret), qos=1).wait_for_publish()
+                sent += len(chunk)
+                chunk = []
+        if chunk:
+            client.publish(RESTOCK_TOPIC, sign_message("\n".join(chunk).encode(), secret), qos=1).wait_for_publish()
+            sent += len(chunk)
+    finally:
+        client.loop_stop()
+        client.disconnect()
+    return sent
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply a restock manifest (CSV or JSON lines)")
+    parser.add_argument("manifest")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--db", default="smart_cart.db")
+    parser.add_argument("--inventory", default="inventory.json")
+    parser.add_argument("--dry-run", action="store_true", help="check the manifest without changing anything")
+    parser.add_argument("--publish", metavar="HOST", help="send the manifest to running carts over MQTT instead")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+
+    if args.publish:
+        secret = restock_secret()
+        if secret is None:
+            parser.error(f"--publish needs the shared secret in {SECRET_ENV}")
+        print(f"Published {publish_manifest(args.manifest, args.publish, args.port, secret)} lines to {RESTOCK_TOPIC}")
+    else:
+        storage = open_storage(args.storage, args.db, args.inventory)
+        if not args.dry_run and not storage.claim():
+            # Its write-behind would overwrite our changes with its own copy of the stock
+            parser.error(f"{args.inventory} is in use by a running cart; send the manifest with --publish instead")
+        catalog = Catalog(storage)
+        catalog.load()
+        report = apply_restock(catalog, read_manifest(args.manifest), args.dry_run)
+        storage.close()
+        for line_no, reason in report.rejects:
+            print(f"Line {line_no}: {reason}")
+        print(("Dry run: " if args.dry_run else "") + str(report))
@@ -0,0 +1,97 @@
+import os
+import struct
+import threading
+import time
+
+from catalog import raw_key
+
+# One append-only file per day, sales/YYYY-MM-DD.sales, memory-mappable as a flat array:
+#
+#   header : magic "SCSALES1" (8 bytes) | record size u32 | reserved u32
+#   record : timestamp u32 | sale id u32 | quantity i32 | unit price i32 | net i32 | item code 8 bytes | cart id u16 | reserved u16
+#
+# Prices are integer paise. Every sale is its item records followed by one summary record
+# whose item code is all NULs: its quantity is the number of units in the basket and its
+# net is the amount paid (after bundles and tax), so revenue never has to be re-derived.
+MAGIC = b"SCSALES1"
+HEADER = struct.Struct("<8sII")
+RECORD = struct.Struct("<IIiii8sHH")
+SUMMARY_CODE = b"\0" * 8
+
+
+class SalesLog:
+    """Appends completed bills to per-day segment files"""
+
+    def __init__(self, directory="sales"):
+        self.directory = directory
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def segment_path(self, day):
+        return os.path.join(self.directory, f"{day}.sales")
+
+    def segments(self):
+        # Oldest first; the file names sort by date
+        return [os.path.join(self.directory, name) for name in sorted(os.listdir(self.directory)) if name.endswith(".sales")]
+
+    def record_sale(self, bill, cart_id=0, when=None):
+        """Appends one bill as a sale and returns its sale number (1, 2, 3... within the day)"""
+        when = time.time() if when is None else when
+        timestamp = int(when)
+        path = self.segment_path(time.strftime("%Y-%m-%d", time.localtime(when)))
+
+        with self.lock:
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size < HEADER.size:
+                size = 0  # Missing, or cut off inside the header: start the segment over
+
+            with open(path, "r+b" if size else "wb") as file:
+                records, last_sale_id = 0, 0
+                if size:
+                    records, last_sale_id = last_sale(file, (size - HEADER.size) // RECORD.size)
+                sale_id = last_sale_id + 1
+
+                data = bytearray()
+                if size == 0:
+                    data += HEADER.pack(MAGIC, RECORD.size, 0)
+                units = 0
+                for line in bill.lines.values():
+                    unit = bill.pricing.lines[line.item_code].unit
+                    data += RECORD.pack(timestamp, sale_id, line.quantity, unit, bill.pricing.line_net(line.item_code),
+                                        raw_key(line.item_code.encode("ascii")), cart_id, 0)
+                    units += line.quantity
+                data += RECORD.pack(timestamp, sale_id, units, 0, bill.total, SUMMARY_CODE, cart_id, 0)
+
+                if size:
+                    file.truncate(HEADER.size + records * RECORD.size)
+                    file.seek(0, os.SEEK_END)
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())  # A sale is money; it must survive a power cut
+        return sale_id
+
+
+def last_sale(file, records):
+    """Finds the last complete sale in a segment of `records` whole records; returns (records up to its end, its sale id)
+
+    A crash mid-write can leave half a record, or item records without their summary, at
+    the end; they are not part of any sale and the next one is written over them. Only the
+    tail is read, so this stays cheap however long the day has been.
+    """
+    for index in range(records - 1, -1, -1):
+        file.seek(HEADER.size + index * RECORD.size)
+        record = RECORD.unpack(file.read(RECORD.size))
+        if record[5] == SUMMARY_CODE:
+            return index + 1, record[1]
+    return 0, 0
+
+
+def read_segment(path):
+    """Yields records as tuples without NumPy, for small tools and checks (see analytics.py for bulk work)"""
+    with open(path, "rb") as file:
+        magic, record_size, _ = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError(f"{path} is not a sales segment")
+        data = file.read()
+    usable = len(data) - len(data) % RECORD.size
+    yield from RECORD.iter_unpack(memoryview(data)[:usable])
@@ -0,0 +1,40 @@
+import threading
+import time
+
+
+class StartupTimer:
+    """Times each startup phase and prints it as soon as the phase finishes
+
+    Phases may overlap (catalog load and MQTT connect run in the background while the
+    login screen is already up), so each one reports its own duration plus how long
+    after process start it finished.
+    """
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.pending = {}  # phase -> perf_counter() when it began
+        self.phases = []  # (phase, duration, finished since start), in finishing order
+        self.lock = threading.Lock()
+
+    def begin(self, phase):
+        with self.lock:
+            self.pending[phase] = time.perf_counter()
+
+    def end(self, phase):
+        now = time.perf_counter()
+        with self.lock:
+            began = self.pending.pop(phase, None)
+            if began is None:
+                return
+            self.phases.append((phase, now - began, now - self.started))
+        print(f"Startup: {phase} took {(now - began) * 1000:.1f} ms (done at {(now - self.started) * 1000:.1f} ms)")
+
+    def mark(self, phase):
+        # A phase that started with the process, e.g. "imports" or "first frame"
+        with self.lock:
+            self.pending[phase] = self.started
+        self.end(phase)
+
+    def is_pending(self, phase):
+        with self.lock:
+            return phase in self.pending
@@ -0,0 +1,483 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Not on Windows; claim() then always succeeds
+
+from bill import BillLine
+from catalog import CatalogItem
+from metrics import METRICS
+
+
+class WriteBehind:
+    """Coalesces many change notifications into one delayed write"""
+
+    def __init__(self, write, delay=0.5):
+        self.write = write
+        self.delay = delay
+        self.pending = False
+        self.held = 0  # Nesting depth of hold(); nothing is written while held
+        self.held_pending = False  # pending as it was when the hold started
+        self._timer = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # Timer and flush() must never write at the same time
+
+    def schedule(self):
+        # Only the first change after a flush arms the timer, later ones ride along
+        with self._lock:
+            self.pending = True
+            self._arm()
+
+    def _arm(self):
+        # Caller holds self._lock
+        if self._timer is None:
+            self._timer = threading.Timer(self.delay, self._run)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def hold(self):
+        # Keep changes in memory until the matching release(), e.g. for the length of a batch
+        with self._lock:
+            if self.held == 0:
+                self.held_pending = self.pending
+            self.held += 1
+
+    def release(self, discard=False):
+        # discard=True forgets what was scheduled during the hold (the caller undid it in memory)
+        with self._lock:
+            self.held -= 1
+            if self.held:
+                return
+            if discard:
+                self.pending = self.held_pending
+            if self.pending:
+                self._arm()
+
+    def _run(self):
+        with self._lock:
+            self._timer = None
+            if not self.pending or self.held:
+                return  # release() arms the timer again
+            self.pending = False
+        with self._write_lock:
+            self.write()
+
+    def flush(self):
+        # Write any pending changes right now (used on shutdown)
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self.pending:
+                return
+            self.pending = False
+        with self._write_lock:
+            self.write()
+
+
+def write_json_atomic(path, data):
+    # Write to a temp file first so a crash never leaves a half-written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file, indent=4)
+        file.flush()
+        os.fsync(file.fileno())  # The session journal counts on a saved inventory staying saved
+    os.replace(tmp_path, path)
+
+
+# Every storage backend offers the same operations, used by Catalog, Bill and Cart:
+#
+#   load_items() / load_bill()          -> CatalogItem / BillLine lists
+#   transaction()                       -> context manager; nest freely, the outermost one commits
+#   take_stock(item, quantity)          -> units actually taken (never drives stock below zero)
+#   return_stock(item, quantity)
+#   restock_all(items, amount)
+#   adjust_stock(item, delta)           -> False (and nothing changed) if stock would go below zero
+#   set_price(item, price)
+#   save_bill_line(bill, line)          -> a line with quantity 0 is deleted
+#   clear_bill() / replace_bill(bill)
+#   inventory_changed()                 -> True if someone else changed the inventory since we loaded it
+#   claim()                             -> False if another process is already writing this storage
+#   flush() / close()
+#   transactional                       -> True if stock and bill lines are committed together
+#
+# Storage methods also keep the in-memory CatalogItem quantities in step with what they stored.
+
+
+class JsonStorage:
+    """inventory.json + bill.json, rewritten in full by a coalescing write-behind
+
+    Fine for a small shop with a single cart; use SqliteStorage for anything bigger.
+
+    The two files are written separately, so after a crash they can disagree; journal.py
+    repairs that. Every stock change bumps `version`. Before a write, the before_save hooks
+    run (the journal is flushed first). After inventory.json is on disk, the after_save
+    hooks are called with the version it contains.
+    """
+
+    transactional = False
+
+    def __init__(self, inventory_path="inventory.json", bill_path="bill.json", flush_delay=0.5):
+        self.inventory_path = inventory_path
+        self.bill_path = bill_path
+        self.items = []
+        self.bill = None
+        self.mtime = None
+        self.inventory_writer = WriteBehind(self._write_inventory, flush_delay)
+        self.bill_writer = WriteBehind(self._write_bill, flush_delay)
+        self.lock = threading.Lock()  # Held while stock changes and while the writer takes its snapshot
+        self.version = 0
+        self.before_save = []
+        self.after_save = []
+        self.lock_file = None  # Held open while we have the files claimed
+
+    def load_items(self):
+        with open(self.inventory_path, "r") as file:
+            data = json.load(file)
+        self.items = [CatalogItem.from_dict(entry) for entry in data]
+        self.mtime = os.stat(self.inventory_path).st_mtime_ns
+        return self.items
+
+    def load_bill(self):
+        with open(self.bill_path, "r") as file:
+            data = json.load(file)
+        return [BillLine.from_dict(entry) for entry in data]
+
+    @contextmanager
+    def transaction(self):
+        # Memory is the source of truth here; the files catch up through write-behind. Nothing is
+        # written until the outermost transaction ends, so a file never shows half a batch, and a
+        # failed transaction drops its writes (callers put memory back before it ends)
+        self.inventory_writer.hold()
+        self.bill_writer.hold()
+        try:
+            yield
+        except BaseException:
+            self.inventory_writer.release(discard=True)
+            self.bill_writer.release(discard=True)
+            raise
+        self.inventory_writer.release()
+        self.bill_writer.release()
+
+    def take_stock(self, item, quantity):
+        with self.lock:
+            taken = min(quantity, max(0, item.quantity))
+            if taken:
+                item.quantity -= taken
+                self.version += 1
+        if taken:
+            self.inventory_writer.schedule()
+        return taken
+
+    def return_stock(self, item, quantity):
+        with self.lock:
+            item.quantity += quantity
+            self.version += 1
+        self.inventory_writer.schedule()
+
+    def restock_all(self, items, amount):
+        with self.lock:
+            for item in items:
+                item.quantity += amount
+            self.version += 1
+        self.inventory_writer.schedule()
+
+    def adjust_stock(self, item, delta):
+        with self.lock:
+            if item.quantity + delta < 0:
+                return False
+            item.quantity += delta
+            self.version += 1
+        self.inventory_writer.schedule()
+        return True
+
+    def set_price(self, item, price):
+        with self.lock:
+            item.price_per_quantity = price
+            self.version += 1
+        self.inventory_writer.schedule()
+
+    def save_bill_line(self, bill, line):
+        self.bill = bill
+        self.bill_writer.schedule()
+
+    def clear_bill(self):
+        # Written straight away: this runs at startup, right before the bill is loaded again
+        self.bill = None
+        self.bill_writer.pending = False
+        write_json_atomic(self.bill_path, [])
+
+    def replace_bill(self, bill):
+        self.bill = bill
+        self.bill_writer.schedule()
+
+    def inventory_changed(self):
+        # Someone edited inventory.json by hand; ignored while we still have unsaved changes
+        try:
+            mtime = os.stat(self.inventory_path).st_mtime_ns
+        except OSError:
+            return False
+        return mtime != self.mtime and not self.inventory_writer.pending
+
+    def claim(self):
+        """Takes inventory.json for this process until close(); False if another process has it
+
+        Whichever process writes last wins, so a second writer's changes would be lost under
+        the first one's write-behind. The lock is an flock on inventory.json.lock, which the
+        OS drops when the process exits, however it exits.
+        """
+        if fcntl is None or self.lock_file is not None:
+            return True
+        file = open(self.inventory_path + ".lock", "a+")
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            return False
+        # The pid is only there for whoever wonders who holds the lock
+        file.truncate(0)
+        file.write(f"{os.getpid()}\n")
+        file.flush()
+        self.lock_file = file
+        return True
+
+    def flush(self):
+        self.inventory_writer.flush()
+        self.bill_writer.flush()
+
+    def close(self):
+        self.flush()
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def _write_inventory(self):
+        # Snapshot quickly, do the slow file write afterwards
+        with self.lock:
+            data = [item.to_dict() for item in list(self.items)]
+            version = self.version
+        for hook in self.before_save:
+            hook()
+        with METRICS.span("persist"):
+            write_json_atomic(self.inventory_path, data)
+        self.mtime = os.stat(self.inventory_path).st_mtime_ns
+        for hook in self.after_save:
+            hook(version)
+
+    def _write_bill(self):
+        data = self.bill.to_list() if self.bill is not None else []
+        for hook in self.before_save:
+            hook()
+        with METRICS.span("persist"):
+            write_json_atomic(self.bill_path, data)
+
+
+class SqliteStorage:
+    """Inventory and bill in one SQLite database in WAL mode
+
+    Every scan is a transaction (check stock, decrement, upsert bill line) that touches
+    single rows through the primary key. Nested transactions become savepoints, so a
+    burst of scans wrapped in one outer transaction() is committed with a single fsync.
+    """
+
+    transactional = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS items (
+            item_code TEXT PRIMARY KEY,
+            item_name TEXT NOT NULL,
+            name_key TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            price_per_quantity REAL NOT NULL,
+            rfid_uid TEXT
+        );
+        CREATE INDEX IF NOT EXISTS items_name_key ON items (name_key);
+        CREATE TABLE IF NOT EXISTS bill_lines (
+            item_code TEXT PRIMARY KEY,
+            item_name TEXT NOT NULL,
+            cost_per_unit REAL NOT NULL,
+            quantity INTEGER NOT NULL,
+            position INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path="smart_cart.db"):
+        self.path = path
+        self.lock = threading.RLock()
+        self.depth = 0  # Transaction nesting level
+        # Autocommit mode; transactions are opened explicitly in transaction()
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL: a crash may lose the last commit, never corrupt
+        self.db.executescript(self.SCHEMA)
+        self.data_version = self._data_version()
+
+    def _data_version(self):
+        # Changes whenever another connection commits to the database
+        return self.db.execute("PRAGMA data_version").fetchone()[0]
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            level = self.depth
+            if level == 0:
+                self.db.execute("BEGIN IMMEDIATE")  # Take the write lock up front so check-and-decrement can't race
+            else:
+                self.db.execute(f"SAVEPOINT scan_{level}")
+            self.depth += 1
+            try:
+                yield
+            except BaseException:
+                self.depth -= 1
+                if level == 0:
+                    self.db.execute("ROLLBACK")
+                else:
+                    self.db.execute(f"ROLLBACK TO scan_{level}")
+                    self.db.execute(f"RELEASE scan_{level}")
+                raise
+            self.depth -= 1
+            if level == 0:
+                with METRICS.span("persist"):
+                    self.db.execute("COMMIT")
+            else:
+                self.db.execute(f"RELEASE scan_{level}")
+
+    def load_items(self):
+        with self.lock:
+            rows = self.db.execute("SELECT item_code, item_name, quantity, price_per_quantity, rfid_uid FROM items ORDER BY rowid").fetchall()
+            self.data_version = self._data_version()
+        return [CatalogItem(*row) for row in rows]
+
+    def load_bill(self):
+        with self.lock:
+            rows = self.db.execute("SELECT item_code, item_name, cost_per_unit, quantity FROM bill_lines ORDER BY position").fetchall()
+        return [BillLine(*row) for row in rows]
+
+    def take_stock(self, item, quantity):
+        with self.transaction():
+            row = self.db.execute("SELECT quantity FROM items WHERE item_code = ?", (item.item_code,)).fetchone()
+            if row is None:
+                return 0
+            taken = min(quantity, max(0, row[0]))
+            if taken:
+                self.db.execute("UPDATE items SET quantity = quantity - ? WHERE item_code = ?", (taken, item.item_code))
+        # The database wins if another writer changed this item's stock behind our back
+        item.quantity = row[0] - taken
+        return taken
+
+    def return_stock(self, item, quantity):
+        with self.transaction():
+            self.db.execute("UPDATE items SET quantity = quantity + ? WHERE item_code = ?", (quantity, item.item_code))
+        item.quantity += quantity
+
+    def restock_all(self, items, amount):
+        with self.transaction():
+            self.db.execute("UPDATE items SET quantity = quantity + ?", (amount,))
+        for item in items:
+            item.quantity += amount
+
+    def adjust_stock(self, item, delta):
+        with self.transaction():
+            row = self.db.execute("SELECT quantity FROM items WHERE item_code = ?", (item.item_code,)).fetchone()
+            if row is None or row[0] + delta < 0:
+                return False
+            self.db.execute("UPDATE items SET quantity = quantity + ? WHERE item_code = ?", (delta, item.item_code))
+        item.quantity = row[0] + delta
+        return True
+
+    def set_price(self, item, price):
+        with self.transaction():
+            self.db.execute("UPDATE items SET price_per_quantity = ? WHERE item_code = ?", (price, item.item_code))
+        item.price_per_quantity = price
+
+    def save_bill_line(self, bill, line):
+        with self.transaction():
+            if line.quantity <= 0:
+                self.db.execute("DELETE FROM bill_lines WHERE item_code = ?", (line.item_code,))
+            else:
+                self.db.execute(
+                    "INSERT INTO bill_lines (item_code, item_name, cost_per_unit, quantity, position) "
+                    "VALUES (?, ?, ?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM bill_lines)) "
+                    "ON CONFLICT (item_code) DO UPDATE SET quantity = excluded.quantity",
+                    (line.item_code, line.item_name, line.cost_per_unit, line.quantity))
+
+    def clear_bill(self):
+        with self.transaction():
+            self.db.execute("DELETE FROM bill_lines")
+
+    def replace_bill(self, bill):
+        with self.transaction():
+            self.db.execute("DELETE FROM bill_lines")
+            self.db.executemany(
+                "INSERT INTO bill_lines (item_code, item_name, cost_per_unit, quantity, position) VALUES (?, ?, ?, ?, ?)",
+                [(line.item_code, line.item_name, line.cost_per_unit, line.quantity, position)
+                 for position, line in enumerate(bill.lines.values())])
+
+    def inventory_changed(self):
+        with self.lock:
+            return self._data_version() != self.data_version
+
+    def flush(self):
+        # Commits are already durable; just fold the WAL back into the main file
+        with self.lock:
+            if self.depth == 0:
+                self.db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def claim(self):
+        # SQLite already lets any number of processes write safely
+        return True
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def import_json(self, inventory_path="inventory.json", bill_path="bill.json"):
+        """One-shot import of the JSON files; existing rows with the same item_code are replaced"""
+        with open(inventory_path, "r") as file:
+            inventory = json.load(file)
+        bill = []
+        if bill_path and os.path.exists(bill_path):
+            with open(bill_path, "r") as file:
+                bill = json.load(file)
+
+        with self.transaction():
+            self.db.executemany(
+                "INSERT OR REPLACE INTO items (item_code, item_name, name_key, quantity, price_per_quantity, rfid_uid) VALUES (?, ?, ?, ?, ?, ?)",
+                [(entry["item_code"], entry["item_name"], entry["item_name"].lower(), entry["quantity"],
+                  entry["price_per_quantity"], entry.get("rfid_uid")) for entry in inventory])
+            self.db.execute("DELETE FROM bill_lines")
+            self.db.executemany(
+                "INSERT INTO bill_lines (item_code, item_name, cost_per_unit, quantity, position) VALUES (?, ?, ?, ?, ?)",
+                [(entry["item_code"], entry["item_name"], entry["cost_per_unit"], entry["quantity"], position)
+                 for position, entry in enumerate(bill)])
+        return len(inventory), len(bill)
+
+
+def open_storage(kind="json", db_path="smart_cart.db", inventory_path="inventory.json", bill_path="bill.json"):
+    if kind == "sqlite":
+        return SqliteStorage(db_path)
+    if kind == "json":
+        return JsonStorage(inventory_path, bill_path)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Smart Cart storage tools")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    importer = subcommands.add_parser("import-json", help="copy inventory.json and bill.json into a SQLite database")
+    importer.add_argument("--db", default="smart_cart.db")
+    importer.add_argument("--inventory", default="inventory.json")
+    importer.add_argument("--bill", default="bill.json")
+    args = parser.parse_args()
+
+    if args.command == "import-json":
+        storage = SqliteStorage(args.db)
+        items, lines = storage.import_json(args.inventory, args.bill)
+        storage.close()
+        print(f"Imported {items} items and {lines} bill lines into {args.db}")
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+
+class FakeMessage:
+    def __init__(self, topic, payload, qos=1, mid=0, dup=False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.mid = mid
+        self.dup = dup
+
+
+def topic_matches(pattern, topic):
+    # MQTT wildcards: "+" is one level, "#" is the rest
+    pattern_parts = pattern.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(pattern_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+class FakeClient:
+    """Stands in for paho.mqtt.client.Client and its broker, with no network
+
+    connect() and drop() drive the callbacks the way paho's network thread would;
+    deliver() hands a message to the client if one of its subscriptions matches.
+    """
+
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self.subscriptions = {}  # topic -> qos, as the broker currently holds them
+        self.published = []  # (topic, payload, qos, retain)
+        self.connected = False
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+
+    # paho API used by MqttLink
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        self.delays = (min_delay, max_delay)
+
+    def connect_async(self, host, port, keepalive):
+        self.address = (host, port)
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def subscribe(self, topic, qos=0):
+        self.subscriptions[topic] = qos
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload, qos, retain))
+        return SimpleNamespace(rc=0 if self.connected else 4)
+
+    def disconnect(self):
+        self.connected = False
+
+    # Broker side
+
+    def connect(self, rc=0):
+        self.connected = rc == 0
+        self.on_connect(self, None, {}, rc)
+
+    def drop(self, rc=1, lose_subscriptions=True):
+        # Connection lost; a broker that expired the session forgets the subscriptions too
+        self.connected = False
+        if lose_subscriptions:
+            self.subscriptions = {}
+        self.on_disconnect(self, None, rc)
+
+    def deliver(self, topic, payload, qos=1, mid=0, dup=False):
+        if not any(topic_matches(pattern, topic) for pattern in self.subscriptions):
+            return False
+        self.on_message(self, None, FakeMessage(topic, payload, qos, mid, dup))
+        return True
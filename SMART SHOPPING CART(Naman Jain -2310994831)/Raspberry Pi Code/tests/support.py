@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from catalog import Catalog
+from storage import JsonStorage
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class CountingStorage(JsonStorage):
+    """JsonStorage that counts its commits and can be told to fail the next ones"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.depth = 0
+        self.commits = 0
+        self.failures = 0  # How many of the next commits fail
+
+    @contextmanager
+    def transaction(self):
+        with super().transaction():
+            self.depth += 1
+            try:
+                yield
+            finally:
+                self.depth -= 1
+            if self.depth == 0:
+                if self.failures:
+                    self.failures -= 1
+                    raise OSError("disk full")
+                self.commits += 1
+
+
+def temp_dir(test):
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory, True)
+    return directory
+
+
+def temp_catalog(test, storage_factory=JsonStorage):
+    """Catalog over a private copy of the shipped inventory.json, removed after the test"""
+    directory = temp_dir(test)
+    inventory_path = os.path.join(directory, "inventory.json")
+    shutil.copy(os.path.join(SOURCE_DIR, "inventory.json"), inventory_path)
+    bill_path = os.path.join(directory, "bill.json")
+    with open(bill_path, "w") as file:
+        file.write("[]")
+    storage = storage_factory(inventory_path=inventory_path, bill_path=bill_path)
+    test.addCleanup(storage.close)
+    catalog = Catalog(storage)
+    catalog.load()
+    return catalog
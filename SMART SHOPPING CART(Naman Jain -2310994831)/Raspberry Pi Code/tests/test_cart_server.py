@@ -0,0 +1,139 @@
+import asyncio
+import json
+import threading
+import unittest
+
+from bill import Bill
+from cart_server import CartServer
+from fake_mqtt import FakeClient
+from pricing import PricingRules
+from protocol import SCAN_TOPIC, BILL_TOPIC
+from support import CountingStorage, temp_catalog
+
+
+class CartServerTest(unittest.TestCase):
+    def setUp(self):
+        self.catalog = temp_catalog(self, CountingStorage)
+        self.storage = self.catalog.storage
+
+    def make_server(self, **kwargs):
+        return CartServer(self.catalog, "broker", 1883, client_factory=FakeClient, client_id="test-server", **kwargs)
+
+    def run_server(self, server, deliveries, before=None):
+        # Delivers (topic, payload) pairs through the fake broker and waits until every cart is done
+        async def scenario():
+            server.start()
+            client = server.mqtt.client
+            client.connect()
+            if before:
+                await before()
+            for mid, (topic, payload) in enumerate(deliveries, 1):
+                client.deliver(topic, payload, mid=mid)
+            for _ in range(200):
+                await asyncio.sleep(0.01)
+                if not any(session.busy or not session.queue.empty() for session in server.sessions.values()):
+                    break
+            server.stop()
+            for session in server.sessions.values():
+                session.task.cancel()
+            return client
+        return asyncio.run(scenario())
+
+    def bills(self, client):
+        # Latest snapshot published for each cart
+        return {topic.rsplit("/", 1)[1]: json.loads(payload)
+                for topic, payload, _, _ in client.published if topic.startswith(BILL_TOPIC + "/")}
+
+    def test_serves_more_carts_than_the_old_cap(self):
+        server = self.make_server()
+        carts = [str(cart_id) for cart_id in range(1, 101)]
+        client = self.run_server(server, [(f"{SCAN_TOPIC}/{cart_id}", b"+,Orange") for cart_id in carts])
+        self.assertEqual(sorted(server.sessions, key=int), carts)
+        self.assertEqual(server.refused, 0)
+        self.assertEqual(sorted(self.bills(client), key=int), carts)
+
+    def test_refuses_carts_past_max_carts(self):
+        server = self.make_server(max_carts=3)
+        self.run_server(server, [(f"{SCAN_TOPIC}/{cart_id}", b"+,Kiwi") for cart_id in range(1, 6)])
+        self.assertEqual(sorted(server.sessions), ["1", "2", "3"])
+        self.assertEqual(server.refused, 2)
+
+    def test_refuses_unknown_cart_ids(self):
+        server = self.make_server(cart_ids=["7"])
+        self.run_server(server, [(f"{SCAN_TOPIC}/8", b"+,Kiwi"), (f"{SCAN_TOPIC}/cart", b"+,Kiwi")])
+        self.assertEqual(server.sessions, {})
+        self.assertEqual(server.refused, 2)
+
+    def test_waiting_batches_of_many_carts_share_one_commit(self):
+        server = self.make_server()
+        gate = threading.Event()
+
+        async def hold_writer():
+            # Keep the writer busy until every cart has handed over its batch
+            server.call(gate.wait)
+            await asyncio.sleep(0)
+            server.loop.call_later(0.1, gate.set)
+
+        client = self.run_server(server, [(f"{SCAN_TOPIC}/{cart_id}", b"+,Kiwi") for cart_id in range(1, 11)], hold_writer)
+        self.assertEqual(self.storage.commits, 1)
+        self.assertEqual(self.catalog.get("001").quantity, 62 - 10)
+        self.assertEqual(len(self.bills(client)), 10)
+
+    def test_failed_commit_puts_back_only_what_the_batch_touched(self):
+        server = self.make_server()
+        items = self.catalog.items
+        self.storage.failures = 1
+        client = self.run_server(server, [(f"{SCAN_TOPIC}/1", b"+,Kiwi"), (f"{SCAN_TOPIC}/1", b"+,Apple")])
+        self.assertIs(self.catalog.items, items)  # Not reloaded
+        self.assertEqual(self.catalog.get("001").quantity, 62)
+        self.assertEqual(self.catalog.get("002").quantity, 63)
+        bill = self.bills(client)["1"]
+        self.assertEqual(bill["lines"], [])
+        self.assertEqual(bill["results"], [])
+
+    def test_cart_keeps_working_after_a_failed_commit(self):
+        server = self.make_server()
+        self.storage.failures = 1
+        deliveries = [(f"{SCAN_TOPIC}/1", b"+,Kiwi")]
+
+        async def first_batch_fails():
+            server.mqtt.client.deliver(f"{SCAN_TOPIC}/1", b"+,Apple", mid=100)
+            await asyncio.sleep(0.1)
+
+        client = self.run_server(server, deliveries, first_batch_fails)
+        bill = self.bills(client)["1"]
+        self.assertEqual([line["item_name"] for line in bill["lines"]], ["Kiwi"])
+        self.assertEqual(self.catalog.get("001").quantity, 61)
+        self.assertEqual(self.catalog.get("002").quantity, 63)
+
+    def test_bare_scan_topic_goes_to_the_default_cart(self):
+        server = self.make_server(default_cart="1")
+        client = self.run_server(server, [(SCAN_TOPIC, b"+,Kiwi"), (f"{SCAN_TOPIC}/2", b"+,Apple")])
+        self.assertIn(SCAN_TOPIC, client.subscriptions)
+        bills = self.bills(client)
+        self.assertEqual([line["item_name"] for line in bills["1"]["lines"]], ["Kiwi"])
+        self.assertEqual([line["item_name"] for line in bills["2"]["lines"]], ["Apple"])
+
+    def test_bare_scan_topic_is_ignored_without_a_default_cart(self):
+        server = self.make_server()
+        client = self.run_server(server, [(SCAN_TOPIC, b"+,Kiwi")])
+        self.assertNotIn(SCAN_TOPIC, client.subscriptions)
+        self.assertEqual(server.sessions, {})
+
+    def test_thin_client_charges_what_the_server_priced(self):
+        rules = PricingRules(tax_percent=10, prices_include_tax=False, promotions=[{"type": "multibuy", "items": ["001"], "buy": 3, "pay": 2}])
+        server = self.make_server(pricing=rules)
+        client = self.run_server(server, [(f"{SCAN_TOPIC}/1", f"+,Kiwi,{seq}".encode()) for seq in range(3)])
+        snapshot = self.bills(client)["1"]
+
+        # The cart's screen has no promotions of its own
+        bill = Bill()
+        bill.replace(snapshot["lines"], snapshot["pricing"])
+        self.assertEqual(bill.total, snapshot["total_paise"])
+        self.assertEqual(bill.total, 2200)  # Two Kiwis paid for, plus 10% tax
+        self.assertEqual(bill.pricing.line_net("001"), 2000)
+        self.assertFalse(bill.pricing.prices_include_tax)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+
+from fake_mqtt import FakeClient
+from mqtt_link import DedupWindow, MqttLink
+
+
+def make_link(topics=("scans/#",)):
+    received = []
+    link = MqttLink("broker", 1883, topics, lambda client, userdata, msg: received.append(msg.payload),
+                    client_id="test-cart", client_factory=FakeClient)
+    link.start()
+    return link, link.client, received
+
+
+class ReconnectTest(unittest.TestCase):
+    def test_subscribes_on_connect(self):
+        link, client, _ = make_link()
+        self.assertEqual(link.state, "connecting")
+        client.connect()
+        self.assertEqual(link.state, "connected")
+        self.assertEqual(client.subscriptions, {"scans/#": 1})
+
+    def test_failed_connect_is_reported(self):
+        link, client, _ = make_link()
+        client.connect(rc=5)
+        self.assertEqual(link.state, "reconnecting")
+        self.assertIn("5", link.last_error)
+        self.assertEqual(client.subscriptions, {})
+
+    def test_resubscribes_after_reconnect(self):
+        link, client, received = make_link()
+        client.connect()
+        client.drop()
+        self.assertEqual(link.state, "reconnecting")
+        self.assertFalse(client.deliver("scans/1", b"+,Kiwi"))
+
+        client.connect()
+        self.assertEqual(link.status()["reconnects"], 1)
+        self.assertEqual(client.subscriptions, {"scans/#": 1})
+        self.assertTrue(client.deliver("scans/1", b"+,Kiwi", mid=7))
+        self.assertEqual(received, [b"+,Kiwi"])
+
+    def test_topic_added_while_down_is_subscribed_on_reconnect(self):
+        link, client, _ = make_link()
+        client.connect()
+        client.drop()
+        link.add_topic("restock")
+        self.assertNotIn("restock", client.subscriptions)
+        client.connect()
+        self.assertIn("restock", client.subscriptions)
+
+    def test_stop_ignores_late_disconnect(self):
+        link, client, _ = make_link()
+        client.connect()
+        link.stop()
+        client.drop(rc=0)
+        self.assertEqual(link.state, "stopped")
+
+
+class RedeliveryTest(unittest.TestCase):
+    def test_redelivery_is_applied_once(self):
+        link, client, received = make_link()
+        client.connect()
+        client.deliver("scans/1", b"+,Kiwi", mid=3)
+        client.drop(lose_subscriptions=False)
+        client.connect()
+        client.deliver("scans/1", b"+,Kiwi", mid=3, dup=True)
+        self.assertEqual(received, [b"+,Kiwi"])
+        self.assertEqual(link.duplicates, 1)
+
+    def test_reused_packet_id_without_dup_flag_is_new(self):
+        # Packet ids are recycled; only the dup flag marks a resend
+        link, client, received = make_link()
+        client.connect()
+        client.deliver("scans/1", b"+,Kiwi", mid=3)
+        client.deliver("scans/1", b"+,Apple", mid=3)
+        self.assertEqual(received, [b"+,Kiwi", b"+,Apple"])
+
+    def test_same_packet_id_on_another_topic_is_new(self):
+        link, client, received = make_link()
+        client.connect()
+        client.deliver("scans/1", b"+,Kiwi", mid=3)
+        client.deliver("scans/2", b"+,Kiwi", mid=3, dup=True)
+        self.assertEqual(len(received), 2)
+
+    def test_qos0_is_never_deduplicated(self):
+        link, client, received = make_link()
+        client.connect()
+        client.deliver("scans/1", b"+,Kiwi", qos=0, dup=True)
+        client.deliver("scans/1", b"+,Kiwi", qos=0, dup=True)
+        self.assertEqual(len(received), 2)
+
+    def test_publisher_sequence_numbers(self):
+        link, _, _ = make_link()
+        self.assertFalse(link.seen_seq("cart-1", 41))
+        self.assertTrue(link.seen_seq("cart-1", 41))
+        self.assertFalse(link.seen_seq("cart-2", 41))
+
+
+class DedupWindowTest(unittest.TestCase):
+    def test_seen(self):
+        window = DedupWindow(size=4)
+        self.assertFalse(window.seen("a", now=0))
+        self.assertTrue(window.seen("a", now=1))
+        self.assertEqual(window.duplicates, 1)
+
+    def test_oldest_key_is_pushed_out(self):
+        window = DedupWindow(size=2)
+        for key in "abc":
+            window.record(key, now=0)
+        self.assertFalse(window.seen("a", now=0))
+        self.assertTrue(window.seen("c", now=0))
+
+    def test_key_expires_after_ttl(self):
+        window = DedupWindow(ttl=30)
+        window.record("a", now=0)
+        self.assertTrue(window.seen("a", now=29))
+        # Seeing it again restarted the clock
+        self.assertTrue(window.seen("a", now=58))
+        self.assertFalse(window.seen("a", now=89))
+
+
+if __name__ == "__main__":
+    unittest.main()
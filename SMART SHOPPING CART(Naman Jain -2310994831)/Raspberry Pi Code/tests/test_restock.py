@@ -0,0 +1,55 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from storage import JsonStorage
+from support import SOURCE_DIR, temp_catalog
+
+
+class JsonClaimTest(unittest.TestCase):
+    def setUp(self):
+        self.catalog = temp_catalog(self)
+        self.inventory_path = self.catalog.storage.inventory_path
+
+    def test_second_writer_is_refused_until_the_first_closes(self):
+        self.assertTrue(self.catalog.storage.claim())
+        other = JsonStorage(self.inventory_path, None)
+        self.assertFalse(other.claim())
+        self.catalog.storage.close()
+        self.assertTrue(other.claim())
+        other.close()
+
+    def run_cli(self, *args):
+        manifest = os.path.join(os.path.dirname(self.inventory_path), "manifest.jsonl")
+        with open(manifest, "w") as file:
+            file.write(json.dumps({"item_code": "001", "delta": 5}) + "\n")
+        return subprocess.run([sys.executable, os.path.join(SOURCE_DIR, "restock.py"), manifest,
+                               "--inventory", self.inventory_path, *args], capture_output=True, text=True)
+
+    def quantity(self):
+        with open(self.inventory_path) as file:
+            return next(entry["quantity"] for entry in json.load(file) if entry["item_code"] == "001")
+
+    def test_cli_refuses_inventory_of_a_running_cart(self):
+        self.catalog.storage.claim()
+        result = self.run_cli()
+        self.assertEqual(result.returncode, 2)
+        self.assertIn("--publish", result.stderr)
+        self.assertEqual(self.quantity(), 62)
+
+    def test_cli_dry_run_works_while_a_cart_runs(self):
+        self.catalog.storage.claim()
+        result = self.run_cli("--dry-run")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(self.quantity(), 62)
+
+    def test_cli_applies_when_no_cart_runs(self):
+        result = self.run_cli()
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(self.quantity(), 67)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from bill import Bill
+from catalog import CatalogItem
+from sales_log import RECORD, SUMMARY_CODE, SalesLog, read_segment
+from support import temp_dir
+
+WHEN = 1790000000  # Every sale in a test lands in the same day's segment
+
+KIWI = CatalogItem("001", "Kiwi", 10, 10.0)
+APPLE = CatalogItem("002", "Apple", 10, 15.0)
+
+
+def make_bill(*items):
+    bill = Bill()
+    for item in items:
+        bill.add(item)
+    return bill
+
+
+class SaleNumberTest(unittest.TestCase):
+    def setUp(self):
+        self.log = SalesLog(temp_dir(self))
+
+    def record(self, *items):
+        return self.log.record_sale(make_bill(*items), when=WHEN)
+
+    def test_sales_are_numbered_one_by_one(self):
+        # Sales of different sizes must not skip numbers
+        self.assertEqual([self.record(KIWI, APPLE), self.record(KIWI), self.record(APPLE, KIWI)], [1, 2, 3])
+        summaries = [record for record in read_segment(self.log.segments()[0]) if record[5] == SUMMARY_CODE]
+        self.assertEqual([record[1] for record in summaries], [1, 2, 3])
+
+    def test_numbering_goes_on_after_a_torn_sale(self):
+        self.record(KIWI, APPLE)
+        self.record(KIWI)
+        path = self.log.segments()[0]
+        # Power cut while writing sale 3: one whole item record and half of the next
+        with open(path, "ab") as file:
+            file.write(RECORD.pack(WHEN, 3, 1, 1000, 1000, b"001\0\0\0\0\0", 0, 0))
+            file.write(b"\1" * (RECORD.size // 2))
+
+        self.assertEqual(self.record(APPLE), 3)
+        records = list(read_segment(path))
+        self.assertEqual([record[1] for record in records], [1, 1, 1, 2, 2, 3, 3])
+        self.assertEqual(records[-1][5], SUMMARY_CODE)
+
+
+if __name__ == "__main__":
+    unittest.main()
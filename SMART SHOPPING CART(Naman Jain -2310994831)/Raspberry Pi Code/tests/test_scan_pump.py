@@ -0,0 +1,75 @@
+import unittest
+from collections import deque
+
+import main
+from bill import Bill
+from cart import Cart
+from ingest import ScanQueue, parse_scan
+from support import CountingStorage, temp_catalog
+
+
+class FakeNotifier:
+    def __init__(self):
+        self.messages = []
+
+    def notify(self, message, level="info"):
+        self.messages.append((message, level))
+
+
+def make_app(catalog):
+    # The scan pump of a BillApp, without Tk: only what drain_scans() touches is set up
+    app = main.BillApp.__new__(main.BillApp)
+    app.cart_id = None
+    app.pending_snapshot = None
+    app.pending_restocks = deque()
+    app.scan_queue = ScanQueue()
+    app.reported_drops = 0
+    app.failed_commits = 0
+    app.catalog = catalog
+    app.bill = Bill(catalog.storage)
+    app.cart = Cart(catalog, app.bill)
+    app.notifier = FakeNotifier()
+    app.reported = []
+    app.report_scan = app.reported.append
+    return app
+
+
+class FailedCommitTest(unittest.TestCase):
+    def setUp(self):
+        self.catalog = temp_catalog(self, CountingStorage)
+        self.app = make_app(self.catalog)
+        for payload in ["+,Kiwi", "+,Kiwi", "+,Apple"]:
+            self.app.scan_queue.put(parse_scan(payload))
+
+    def test_scans_are_retried_after_a_failed_commit(self):
+        self.catalog.storage.failures = 1
+        self.app.drain_scans()
+        self.assertEqual(len(self.app.scan_queue), 3)
+        self.assertEqual(self.app.reported, [])
+        self.assertEqual(self.app.bill.lines, {})
+
+        self.app.drain_scans()
+        self.assertEqual(len(self.app.scan_queue), 0)
+        self.assertEqual({line.item_name: line.quantity for line in self.app.bill.lines.values()}, {"Kiwi": 2, "Apple": 1})
+        self.assertEqual(self.catalog.get("001").quantity, 62 - 2)
+        self.assertEqual([result.status for result in self.app.reported], ["added", "added"])
+        self.assertEqual(self.app.notifier.messages, [])
+
+    def test_retried_scans_stay_ahead_of_new_ones(self):
+        self.catalog.storage.failures = 1
+        self.app.drain_scans()
+        self.app.scan_queue.put(parse_scan("-,Kiwi"))
+        self.app.drain_scans()
+        self.assertEqual(self.app.bill.get("001").quantity, 1)
+
+    def test_user_is_told_when_scans_are_given_up(self):
+        self.catalog.storage.failures = main.SCAN_COMMIT_RETRIES + 1
+        for _ in range(main.SCAN_COMMIT_RETRIES + 1):
+            self.app.drain_scans()
+        self.assertEqual(len(self.app.scan_queue), 0)
+        self.assertEqual(self.app.notifier.messages, [("3 scans could not be saved, please scan them again", "error")])
+        self.assertEqual(self.catalog.get("001").quantity, 62)
+
+
+if __name__ == "__main__":
+    unittest.main()